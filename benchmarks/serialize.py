@@ -0,0 +1,75 @@
+"""Benchmark HTML serialization of hrepr output.
+
+Compares the current serializer with attribute caching and the escape fast
+path disabled. Run with: python benchmarks/serialize.py
+"""
+
+import html
+import time
+
+from hrepr import H, hgen, hrepr, standard_html
+
+
+def representation(n):
+    data = [
+        {"name": f"item{i}", "values": [i, i + 0.5, str(i)], "ok": i % 2 == 0}
+        for i in range(n)
+    ]
+    return hrepr(data, sequence_max=None, max_depth=None)
+
+
+def table(n):
+    return H.table(
+        H.tr["row"](H.td["cell name"](f"row {i}"), H.td["cell value"](i))
+        for i in range(n)
+    )
+
+
+def clear_html_cache(tag):
+    # Serialized HTML is cached on each Tag, which would hide the cost of
+    # serialization after the first run
+    for t in tag.walk():
+        t._cache = None
+
+
+def best_of(tag, repeat=5):
+    times = []
+    for _ in range(repeat):
+        clear_html_cache(tag)
+        start = time.perf_counter()
+        standard_html.to_string(tag)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def baseline(self, attributes):
+    return self._attribute_string(attributes)
+
+
+def main():
+    benchmarks = {
+        "representation": representation(20_000),
+        "table": table(50_000),
+    }
+    fast = {name: best_of(tag) for name, tag in benchmarks.items()}
+
+    attribute_string = hgen.BlockGenerator.attribute_string
+    escape = hgen.escape
+    hgen.BlockGenerator.attribute_string = baseline
+    hgen.escape = html.escape
+    try:
+        slow = {name: best_of(tag) for name, tag in benchmarks.items()}
+    finally:
+        hgen.BlockGenerator.attribute_string = attribute_string
+        hgen.escape = escape
+
+    print(f"{'benchmark':20}{'baseline':>12}{'current':>12}{'speedup':>10}")
+    for name in benchmarks:
+        print(
+            f"{name:20}{slow[name]:>11.3f}s{fast[name]:>11.3f}s"
+            f"{slow[name] / fast[name]:>9.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
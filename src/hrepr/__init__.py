@@ -2,7 +2,7 @@
 
 from . import elements, h
 from .core import Config, Hrepr, HreprState, Interface, StdHrepr
-from .h import HTML, H, HType, Tag
+from .h import HTML, H, HType, Lazy, Tag
 from .hgen import BlockGenerator, HTMLGenerator, standard_html
 from .j import J, Returns
 from .resource import JSExpression, Resource
@@ -30,6 +30,7 @@ __all__ = [
     "Interface",
     "J",
     "JSExpression",
+    "Lazy",
     "Resource",
     "Returns",
     "StdHrepr",
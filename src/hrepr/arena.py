@@ -0,0 +1,220 @@
+"""Compact storage of large document trees.
+
+An Arena stores nodes in flat arrays instead of one Tag object per node:
+
+* ``names``: the id of each node's name in the string table.
+* ``attr_start``/``attr_count``: the range of each node's attributes in
+  ``attr_keys`` (string ids) and ``attr_values``.
+* ``child_start``/``child_count``: the range of each node's children in
+  ``child_refs``. A non-negative reference is the index of another node, a
+  negative reference ``~i`` is the value ``values[i]`` (text, numbers, or
+  any other object that can be embedded in a Tag).
+
+Nodes are added bottom-up, so the children of a node always exist before
+it does. ArenaNode is a lightweight view on a node with the same read API as
+Tag, and HTMLGenerator serializes it directly from the arrays.
+"""
+
+from array import array
+
+from . import h
+from .h import Tag, flatten
+
+
+class Arena:
+    def __init__(self):
+        self.strings = []
+        self._string_ids = {}
+        self.names = array("I")
+        self.attr_start = array("Q")
+        self.attr_count = array("I")
+        self.attr_keys = array("I")
+        self.attr_values = []
+        self.child_start = array("Q")
+        self.child_count = array("I")
+        self.child_refs = array("q")
+        self.values = []
+        self.resources = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def _string_id(self, s):
+        sid = self._string_ids.get(s, None)
+        if sid is None:
+            sid = self._string_ids[s] = len(self.strings)
+            self.strings.append(s)
+        return sid
+
+    def _child_ref(self, child):
+        if isinstance(child, ArenaNode) and child.arena is self:
+            return child.index
+        self.values.append(child)
+        return ~(len(self.values) - 1)
+
+    def _add(self, name, attributes, refs, resources):
+        index = len(self.names)
+        self.names.append(self._string_id(name))
+        self.attr_start.append(len(self.attr_keys))
+        self.attr_count.append(len(attributes))
+        for k, v in attributes.items():
+            self.attr_keys.append(self._string_id(k))
+            self.attr_values.append(v)
+        self.child_start.append(len(self.child_refs))
+        self.child_count.append(len(refs))
+        self.child_refs.extend(refs)
+        if resources:
+            self.resources[index] = tuple(resources)
+        return index
+
+    def add(self, name, *children, resources=None, **attributes):
+        """Add a node and return an ArenaNode for it.
+
+        The arguments are the same as when calling a Tag. Children that are
+        nodes of this arena are stored by reference.
+        """
+        attributes = {
+            attr.replace("_", "-"): value for attr, value in attributes.items()
+        }
+        if len(children) > 0 and isinstance(children[0], dict):
+            attributes = {**children[0], **attributes}
+            children = children[1:]
+        if isinstance(resources, Tag):
+            resources = (resources,)
+        refs = [self._child_ref(child) for child in flatten(children)]
+        return ArenaNode(self, self._add(name, attributes, refs, resources))
+
+    def add_tag(self, tag):
+        """Copy a Tag and all of its descendants into the arena.
+
+        Returns the ArenaNode for the root. A subtree that occurs several
+        times in the Tag is only stored once.
+        """
+        indexes = {}
+        stack = [tag]
+        while stack:
+            t = stack[-1]
+            if id(t) in indexes:
+                stack.pop()
+                continue
+            pending = [
+                c
+                for c in t.children
+                if isinstance(c, Tag) and id(c) not in indexes
+            ]
+            if pending:
+                stack.extend(reversed(pending))
+                continue
+            stack.pop()
+            refs = [
+                indexes[id(c)] if isinstance(c, Tag) else self._child_ref(c)
+                for c in t.children
+            ]
+            indexes[id(t)] = self._add(t.name, t.attributes, refs, t.resources)
+        return ArenaNode(self, indexes[id(tag)])
+
+    def name(self, index):
+        return self.strings[self.names[index]]
+
+    def attributes(self, index):
+        start = self.attr_start[index]
+        end = start + self.attr_count[index]
+        return {
+            self.strings[self.attr_keys[i]]: self.attr_values[i]
+            for i in range(start, end)
+        }
+
+    def refs(self, index):
+        start = self.child_start[index]
+        return self.child_refs[start : start + self.child_count[index]]
+
+    def children(self, index):
+        return tuple(
+            ArenaNode(self, ref) if ref >= 0 else self.values[~ref]
+            for ref in self.refs(index)
+        )
+
+    def materialize(self, index):
+        """Create the Tag for the node at the given index."""
+        built = {}
+        stack = [index]
+        while stack:
+            i = stack[-1]
+            if i in built:
+                stack.pop()
+                continue
+            pending = [r for r in self.refs(i) if r >= 0 and r not in built]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            name = self.name(i)
+            built[i] = Tag.specialize(name)(
+                name=name,
+                attributes=self.attributes(i),
+                children=tuple(
+                    built[r] if r >= 0 else self.values[~r]
+                    for r in self.refs(i)
+                ),
+                resources=self.resources.get(i, ()),
+            )
+        return built[index]
+
+
+class ArenaNode:
+    """View on a node of an Arena, with the same read API as Tag."""
+
+    __slots__ = ("arena", "index")
+
+    def __init__(self, arena, index):
+        self.arena = arena
+        self.index = index
+
+    @property
+    def name(self):
+        return self.arena.name(self.index)
+
+    @property
+    def attributes(self):
+        return self.arena.attributes(self.index)
+
+    @property
+    def children(self):
+        return self.arena.children(self.index)
+
+    @property
+    def resources(self):
+        return self.arena.resources.get(self.index, ())
+
+    @property
+    def id(self):
+        return self.get_attribute("id", None)
+
+    def get_attribute(self, attr, dflt):
+        return self.attributes.get(attr, dflt)
+
+    def materialize(self):
+        """Create the equivalent Tag."""
+        return self.arena.materialize(self.index)
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, ArenaNode)
+            and self.arena is other.arena
+            and self.index == other.index
+        )
+
+    def __hash__(self):
+        return hash((id(self.arena), self.index))
+
+    def __repr__(self):
+        return str(self)
+
+    def __str__(self):
+        return h.standard_html.to_string(self)
+
+    def as_page(self):
+        """
+        Wrap this node as a self-contained webpage.
+        """
+        return h.standard_html.as_page(self)
@@ -0,0 +1,83 @@
+"""Resources written to files instead of being inlined in pages.
+
+When pages are generated with an AssetDirectory, stylesheets and scripts
+in their resources (hrepr's own CSS, the JavaScript library used by J
+objects, ``__hrepr_resources__``, etc.) are written to the directory once,
+under a name derived from a hash of their contents, and the pages refer to
+them with ``<link>`` and ``<script src>``. Since a file's contents never
+change for a given name, the files can be cached indefinitely by browsers
+and proxies.
+"""
+
+import hashlib
+import os
+import tempfile
+from threading import Lock
+
+from .h import H, Tag
+
+
+def _text_children(tag):
+    return all(isinstance(c, str) for c in tag.children)
+
+
+class AssetDirectory:
+    """Directory where resources are written.
+
+    Arguments:
+        directory: The directory where to write the files. It is created if
+            it does not exist.
+        url: The URL under which the files are served, with a trailing
+            slash. By default, files are referred to by their name, which
+            works if the pages are in the same directory.
+    """
+
+    def __init__(self, directory, url=""):
+        self.directory = os.fspath(directory)
+        self.url = url
+        self._written = set()
+        self._lock = Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def write(self, content, extension):
+        """Write content to a file named after its hash and return its URL."""
+        data = content.encode("utf8")
+        filename = f"{hashlib.sha256(data).hexdigest()[:20]}.{extension}"
+        path = os.path.join(self.directory, filename)
+        with self._lock:
+            if filename not in self._written:
+                if not os.path.exists(path):
+                    fd, tmp = tempfile.mkstemp(
+                        dir=self.directory, suffix=".tmp"
+                    )
+                    try:
+                        with os.fdopen(fd, "wb") as f:
+                            f.write(data)
+                        os.replace(tmp, path)
+                    except BaseException:  # pragma: no cover
+                        os.unlink(tmp)
+                        raise
+                self._written.add(filename)
+        return self.url + filename
+
+    def externalize(self, tag, blk):
+        """Return a Tag that refers to tag's contents in a file.
+
+        Only inline ``<style>`` and ``<script>`` elements whose children are
+        all strings are written to a file. Other Tags are returned as they
+        are.
+        """
+        if not isinstance(tag, Tag) or not _text_children(tag):
+            return tag
+        attributes = tag.attributes
+        if tag.name == "style" and not attributes:
+            href = self.write("".join(tag.children), "css")
+            return H.link(rel="stylesheet", href=href)
+        elif tag.name == "script" and set(attributes) <= {"type"}:
+            code = "".join(
+                str(blk.script_node_embed(child)) for child in tag.children
+            )
+            src = self.write(code, "js")
+            return H.script(attributes, src=src)
+        else:
+            return tag
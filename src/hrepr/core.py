@@ -2,21 +2,34 @@ import math
 import types
 from collections import Counter
 from dataclasses import fields as dataclass_fields
+from dataclasses import is_dataclass
 from enum import Enum
-from pathlib import Path
 from typing import Protocol, Union, runtime_checkable
 
 from ovld import Dataclass, OvldMC, call_next, extend_super, ovld
 
-from .h import H, Tag
+from . import resource
+from .h import H, Tag, bounded_setdefault
+from .hgen import standard_html
 from .j import J
 from .make import StandardMaker
+from .resource import read_asset
 
 ABSENT = object()
 
 _type = type
-here = Path(__file__).parent
-styledir = here / "style"
+DictKeys = _type({}.keys())
+DictValues = _type({}.values())
+
+
+def __getattr__(name):
+    # Computed lazily to avoid importing pathlib with hrepr
+    if name in ("here", "styledir"):
+        from pathlib import Path
+
+        here = Path(__file__).parent
+        return here if name == "here" else here / "style"
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class Config:
@@ -50,33 +63,62 @@ class HreprResourcesProtocol(Protocol):  # pragma: no cover
     def __hrepr_resources__(cls): ...
 
 
+# Objects of these types have no identity worth showing, so they are never
+# registered and never displayed as references.
+_atomic_types = (type(None), bool, int, float, complex, str, bytes, Tag)
+
+
 class HreprState:
     def __init__(self):
         self.types_seen = set()
         self.stack = Counter()
+        # Maps id(obj) -> (obj, value). Holding obj keeps the id valid until
+        # the end of the render, so it cannot be reused by another object.
         self.registry = {}
         self.depth = -1
         self.refs = {}
+        # Set of ids found by find_shared, or None if there was no pre-scan
+        self.shared = None
+        # Ids from shared that were labelled but not referenced again yet
+        self.unreferenced = set()
+
+    def shareable(self, obj):
+        return not isinstance(obj, _atomic_types)
 
     def get_ref(self, objid):
         return self.refs.setdefault(objid, len(self.refs) + 1)
 
-    def registered(self, objid):
-        return objid in self.registry
+    def registered(self, obj):
+        return id(obj) in self.registry
 
-    def register(self, objid, value):
-        self.registry.setdefault(objid, value)
+    def register(self, obj, value):
+        if self.shareable(obj):
+            self.registry.setdefault(id(obj), (obj, value))
 
-    def reregister(self, objid, value):
+    def reregister(self, obj, value):
+        objid = id(obj)
         if objid in self.registry:
-            self.registry[objid] = value
+            self.registry[objid] = (obj, value)
 
     def make_refmap(self):
+        # References to pre-scanned objects are already in place
+        shared = self.shared or ()
         rval = {}
         for objid, label in self.refs.items():
-            rval[id(self.registry[objid])] = label
+            if objid not in shared:
+                _, value = self.registry[objid]
+                rval[id(value)] = label
         return rval
 
+    def release(self):
+        """Drop all references to the objects seen during the render."""
+        self.types_seen.clear()
+        self.stack.clear()
+        self.registry.clear()
+        self.refs.clear()
+        self.shared = None
+        self.unreferenced.clear()
+
 
 class Hrepr(metaclass=OvldMC):
     @classmethod
@@ -100,22 +142,31 @@ class Hrepr(metaclass=OvldMC):
         self.preprocess = preprocess
         self.postprocess = postprocess
         self.make = maker(self)
+        self._runners = {}
+
+    def _make_runner(self, config):
+        cfg = self.config.with_config(config)
+        return type(self)(
+            H=self.H,
+            config=cfg,
+            master=self.master,
+            preprocess=self.preprocess,
+            postprocess=self.postprocess,
+        )
 
     def with_config(self, config):
         if not config:
             return self
         else:
-            cfg = self.config.with_config(config)
-            return type(self)(
-                H=self.H,
-                config=cfg,
-                master=self.master,
-                preprocess=self.preprocess,
-                postprocess=self.postprocess,
+            return _cached(
+                self._runners,
+                _options_key(config),
+                lambda: self._make_runner(config),
             )
 
     def ref(self, obj, loop=False):
         num = self.state.get_ref(id(obj))
+        self.state.unreferenced.discard(id(obj))
         if self.config.shortrefs:
             return self.make.ref(loop=loop, num=num)
         else:
@@ -140,7 +191,7 @@ class Hrepr(metaclass=OvldMC):
         if rval is NotImplemented:
             return self.hrepr_short(obj)
         else:
-            self.state.register(id(obj), rval)
+            self.state.register(obj, rval)
             return rval
 
     @ovld(priority=10)
@@ -165,9 +216,7 @@ class Hrepr(metaclass=OvldMC):
             else:
                 return f"{mn}.{tx.__qualname__}"
 
-        rval = self.make.atom("<", _xtn(obj), ">", type=type(obj))
-        self.state.register(id(obj), rval)
-        return rval
+        return self.make.atom("<", _xtn(obj), ">", type=type(obj))
 
     def __call__(self, obj, **config):
         if self.preprocess is not None:
@@ -179,11 +228,7 @@ class Hrepr(metaclass=OvldMC):
         if self.state.stack[ido]:
             return runner.ref(obj, loop=True)
 
-        if (
-            not isinstance(obj, Tag)
-            and self.state.registered(ido)
-            and not runner.config.norefs
-        ):
+        if self.state.registered(obj) and not runner.config.norefs:
             return runner.ref(obj)
 
         # Push object on the stack to detect circular references
@@ -200,7 +245,7 @@ class Hrepr(metaclass=OvldMC):
 
         if self.postprocess is not None:
             rval = self.postprocess(rval, obj, self)
-            self.state.reregister(id(obj), rval)
+            self.state.reregister(obj, rval)
 
         # Check that it's the right type
         htype = self.H._tag_class
@@ -219,7 +264,15 @@ class Hrepr(metaclass=OvldMC):
         # Collect resources for this object
         resources = self.hrepr_resources(type(obj))
         rval = rval.fill(resources=resources)
-        self.state.reregister(id(obj), rval)
+        if (
+            self.state.shared is not None
+            and ido in self.state.shared
+            and self.state.registered(obj)
+        ):
+            # The pre-scan found other references to obj further on
+            rval = runner.make.ref(num=self.state.get_ref(ido), content=rval)
+            self.state.unreferenced.add(ido)
+        self.state.reregister(obj, rval)
 
         return rval
 
@@ -237,7 +290,7 @@ def _encode(s):
 
 class StdHrepr(Hrepr):
     def global_resources(self):
-        return (self.H.style((styledir / "hrepr.css").read_text()),)
+        return (self.H.style(read_asset("style", "hrepr.css")),)
 
     # Lists
 
@@ -289,7 +342,7 @@ class StdHrepr(Hrepr):
     def hrepr(self, obj: dict):
         return self.make.bracketed(
             self.make.table(
-                [[k, H.span["hrepr-delim"](": "), v] for k, v in obj.items()]
+                [[k, self.make.delimiter(": "), v] for k, v in obj.items()]
             ),
             start="{",
             end="}",
@@ -325,25 +378,25 @@ class StdHrepr(Hrepr):
     # Other structures
 
     @ovld(priority=-1)
-    def hrepr(self, dk: _type({}.keys())):
+    def hrepr(self, dk: DictKeys):
         return self.make.bracketed(
             self.make.flow(dk), start="dict_keys(", end=")", type=type(dk)
         )
 
     @ovld(priority=-1)
-    def hrepr_short(self, dk: _type({}.keys())):
+    def hrepr_short(self, dk: DictKeys):
         return self.make.bracketed(
             self.make.short("..."), start="dict_keys(", end=")", type=type(dk)
         )
 
     @ovld(priority=-1)
-    def hrepr(self, dv: _type({}.values())):
+    def hrepr(self, dv: DictValues):
         return self.make.bracketed(
             self.make.flow(dv), start="dict_values(", end=")", type=type(dv)
         )
 
     @ovld(priority=-1)
-    def hrepr_short(self, dv: _type({}.values())):
+    def hrepr_short(self, dv: DictValues):
         return self.make.bracketed(
             self.make.short("..."), start="dict_values(", end=")", type=type(dv)
         )
@@ -502,35 +555,106 @@ class StdHrepr(Hrepr):
 
 
 def inject_reference_numbers(hcall, node, refmap):
-    if isinstance(node, Tag):
-        new_children = tuple(
-            inject_reference_numbers(hcall, child, refmap)
-            for child in node.children
+    changes = {
+        path: (lambda tag, num=refnum: hcall.make.ref(content=tag, num=num))
+        for path, tag in node.walk(paths=True)
+        if (refnum := refmap.get(id(tag), None)) is not None
+    }
+    return bool(changes), node.update(changes) if changes else node
+
+
+def _prescan_children(obj):
+    if isinstance(obj, dict):
+        return [x for row in obj.items() for x in row], len(obj), 2
+    elif isinstance(obj, Exception):
+        return list(obj.args[1:]), len(obj.args) - 1, 1
+    elif isinstance(obj, (list, tuple, set, frozenset, DictKeys, DictValues)):
+        return list(obj), len(obj), 1
+    elif is_dataclass(obj) and not isinstance(obj, type):
+        fields = dataclass_fields(obj)
+        return [getattr(obj, f.name) for f in fields], len(fields), 1
+    else:
+        return (), 0, 1
+
+
+def find_shared(objs, config, state):
+    """Find the ids of the objects that will be displayed more than once.
+
+    This mirrors the traversal of StdHrepr for standard containers, taking
+    max_depth and sequence_max into account. Objects with a custom __hrepr__
+    are not entered, so references that only occur through them are not
+    found here. Conversely, a container rendered by an overridden hrepr
+    method may not display the children found here, in which case the
+    render is done again without the pre-scan.
+    """
+    seen = set()
+    shared = set()
+    max_depth = config.max_depth
+    cap = config.sequence_max
+    to_visit = [(obj, 0) for obj in reversed(objs)]
+    while to_visit:
+        obj, depth = to_visit.pop()
+        if max_depth is not None and depth >= max_depth:
+            continue
+        if not state.shareable(obj):
+            continue
+        objid = id(obj)
+        if objid in seen:
+            shared.add(objid)
+            continue
+        seen.add(objid)
+        if hasattr(type(obj), "__hrepr__"):
+            continue
+        children, n, width = _prescan_children(obj)
+        if cap and cap >= 2 and n > cap:
+            # Same elision as StandardMaker.sequence, with ntrail=2
+            children = children[: (cap - 2) * width] + children[-2 * width :]
+        to_visit.extend((child, depth + 1) for child in reversed(children))
+    return shared
+
+
+# Maximum number of entries in the caches of variants and runners
+_cache_size = 128
+
+# Maps (hclass, *mixins) to the corresponding subclass
+_mixed_classes = {}
+
+
+def _options_key(options):
+    """Return a hashable key for options, or None if they are not hashable.
+
+    Values are compared by type as well, so that e.g. 1 and True differ.
+    """
+    key = tuple(
+        sorted(
+            (k, type(v), tuple(v) if isinstance(v, list) else v)
+            for k, v in options.items()
         )
-        if any(change for change, _ in new_children):
-            new_node = type(node)(
-                name=node.name,
-                attributes=node.attributes,
-                children=tuple(child for _, child in new_children),
-                resources=node.resources,
-            )
-        else:
-            new_node = node
+    )
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
 
-        refnum = refmap.get(id(node), None)
-        if refnum is not None:
-            return True, hcall.make.ref(content=node, num=refnum)
-        else:
-            return True, new_node
-    else:
-        return False, node
+
+def _cached(cache, key, make):
+    if key is None:
+        return make()
+    rval = cache.get(key, None)
+    if rval is None:
+        rval = bounded_setdefault(cache, _cache_size, key, make())
+    return rval
 
 
 def _mix(hclass, mixins):
     if mixins:
         if isinstance(mixins, type):
             mixins = [mixins]
-        hclass = hclass.create_subclass(*mixins)
+        key = (hclass, *mixins)
+        hclass = _mixed_classes.get(key, None) or _mixed_classes.setdefault(
+            key, hclass.create_subclass(*mixins)
+        )
     return hclass
 
 
@@ -543,17 +667,20 @@ class Interface:
         preprocess=ABSENT,
         postprocess=ABSENT,
         inject_references=True,
+        prescan=False,
         fill_resources=True,
         **config_defaults,
     ):
         self.hrepr_options = {}
         self.config_defaults = {}
+        self._variants = {}
         self.configure(
             hclass=hclass,
             mixins=mixins,
             preprocess=preprocess,
             postprocess=postprocess,
             inject_references=inject_references,
+            prescan=prescan,
             fill_resources=fill_resources,
             **config_defaults,
         )
@@ -562,6 +689,7 @@ class Interface:
         return type(self)(
             hclass=self.hclass,
             inject_references=self.inject_references,
+            prescan=self.prescan,
             fill_resources=self.fill_resources,
             **self.hrepr_options,
             **self.config_defaults,
@@ -578,9 +706,11 @@ class Interface:
         preprocess=ABSENT,
         postprocess=ABSENT,
         inject_references=ABSENT,
+        prescan=ABSENT,
         fill_resources=ABSENT,
         **config_defaults,
     ):
+        self._variants.clear()
         if hclass is not None:
             self.hclass = hclass
         self.hclass = _mix(self.hclass, mixins)
@@ -590,36 +720,82 @@ class Interface:
             self.hrepr_options["postprocess"] = postprocess
         if inject_references is not ABSENT:
             self.inject_references = inject_references
+        if prescan is not ABSENT:
+            self.prescan = prescan
         if fill_resources is not ABSENT:
             self.fill_resources = fill_resources
         self.config_defaults.update(config_defaults)
         return self
 
-    def page(self, *objs, file=None, **config):
-        result = self(*objs, **config).as_page()
-        if file is None:
-            return result
-        elif isinstance(file, str):  # pragma: no cover
-            with open(file, "w") as f:
-                f.write(str(result) + "\n")
-        else:  # pragma: no cover
-            file.write(str(result) + "\n")
+    def page(
+        self, *objs, file=None, assets=None, bundle=False, lazy=None, **config
+    ):
+        options = {"assets": assets, "bundle": bundle, "lazy": lazy}
+        # The Resources created by __hrepr__ methods are only needed until
+        # the page is generated
+        with resource.scope():
+            result = self(*objs, **config)
+            if file is None:
+                return result.as_page(**options)
+            elif isinstance(file, str):
+                with open(file, "w", encoding="utf8") as f:
+                    standard_html.write_page(result, f, end="\n", **options)
+            else:
+                standard_html.write_page(result, file, end="\n", **options)
 
-    def __call__(self, *objs, **config):
-        if config:
-            return self.variant(**config)(*objs)
-        else:
-            hcall = self.hclass(
-                H=H, config=Config(self.config_defaults), **self.hrepr_options
-            )
+    def _render(self, objs, prescan):
+        hcall = self.hclass(
+            H=H,
+            config=Config(self.config_defaults),
+            **self.hrepr_options,
+        )
+        try:
+            if (
+                prescan
+                and self.inject_references
+                and hcall.preprocess is None
+                and not hcall.config.norefs
+            ):
+                hcall.state.shared = find_shared(
+                    objs, hcall.config, hcall.state
+                )
             if len(objs) == 1:
                 rval = hcall(objs[0])
             else:
                 rval = H.inline(*map(hcall, objs))
-            if self.inject_references:
-                _, rval = inject_reference_numbers(
-                    hcall, rval, hcall.state.make_refmap()
-                )
+            if hcall.state.unreferenced:
+                return hcall, None
+            refmap = hcall.state.make_refmap()
+            if self.inject_references and refmap:
+                _, rval = inject_reference_numbers(hcall, rval, refmap)
+        finally:
+            hcall.state.release()
+        return hcall, rval
+
+    def __call__(self, *objs, **config):
+        if config:
+            # Unlike variant(), this reuses variants across calls, because
+            # they cannot be modified by the caller
+            variant = _cached(
+                self._variants,
+                _options_key(config),
+                lambda: self.variant(**config),
+            )
+            return variant(*objs)
+        else:
+            # The Resources created by __hrepr__ methods are attached to
+            # the result, so that they are freed along with it
+            with resource.scope() as registry:
+                hcall, rval = self._render(objs, prescan=self.prescan)
+                if rval is None:
+                    # An object that the pre-scan found several times was
+                    # only displayed once, e.g. because an overridden hrepr
+                    # method hid its other occurrences, so it should not
+                    # have been labelled
+                    registry.reset()
+                    hcall, rval = self._render(objs, prescan=False)
             if self.fill_resources:
                 rval = rval.fill(resources=hcall.global_resources())
+            if registry.id_to_resource:
+                rval = rval.fill(resources=(registry,))
             return rval
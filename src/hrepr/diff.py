@@ -0,0 +1,211 @@
+"""Patches that turn the DOM of one rendered Tag into the DOM of another.
+
+``diff(old, new)`` returns a list of operations, each a dict that can be
+serialized to JSON and applied in order with ``$$HREPR.patch(root, ops)``,
+where ``root`` is the element produced by ``old``:
+
+* ``{"op": "replace", "id": ..., "path": [...], "html": ...}`` replaces the
+  element with the given HTML.
+* ``{"op": "insert", "id": ..., "path": [...], "index": i, "html": ...}``
+  inserts the HTML before the i-th element child of the element.
+* ``{"op": "remove", "id": ..., "path": [...]}`` removes the element.
+* ``{"op": "attr", "id": ..., "path": [...], "name": ..., "value": ...}``
+  sets an attribute, or removes it if the value is None.
+
+An element is found by starting from the element with the given ``id`` (or
+from ``root`` if ``id`` is None) and following ``path``, a list of indexes
+in the element children (text nodes are not counted).
+
+The rows of a table are addressed through the ``<tbody>`` element that
+browsers insert around them, and a table that mixes rows with other
+elements is replaced as a whole when it changes.
+
+Elements whose contents cannot be mapped reliably to the DOM (raw HTML,
+J objects, objects represented through hrepr) are replaced as a whole when
+their HTML changes. Resources of the new Tag are not included in the patch,
+and scripts in the inserted HTML are not run, so J objects in the new
+HTML are not instantiated.
+"""
+
+from .arena import ArenaNode
+from .h import Tag
+from .hgen import standard_html
+
+# Sentinel marking the position of an element in a text signature
+_ELEMENT = object()
+
+
+class _Node:
+    __slots__ = (
+        "tag",
+        "name",
+        "attributes",
+        "elements",
+        "texts",
+        "atomic",
+        "tbody",
+    )
+
+    def __init__(self, tag):
+        self.tag = tag
+        self.name = tag.name
+        self.attributes = None
+        self.elements = []
+        # Text and element positions, or None if the element has no text
+        self.texts = []
+        self.atomic = False
+        # True for a table whose children are rows, which browsers put in
+        # an implicit <tbody>
+        self.tbody = False
+
+
+def _normalize(tag, blk):
+    node = _Node(tag)
+    node.attributes = {
+        k: v
+        for k, v in ((k, blk.attr_embed(v)) for k, v in tag.attributes.items())
+        if v is not None and v is not False
+    }
+    has_text = False
+    to_visit = list(reversed(tag.children))
+    while to_visit:
+        child = to_visit.pop()
+        if isinstance(child, ArenaNode):
+            child = child.materialize()
+        if child is None:
+            continue
+        elif isinstance(child, (str, int, float)):
+            text = str(child)
+            if not text:
+                continue
+            has_text = True
+            if node.texts and isinstance(node.texts[-1], str):
+                node.texts[-1] += text
+            else:
+                node.texts.append(text)
+        elif isinstance(child, Tag) and child.name == "inline":
+            to_visit.extend(reversed(child.children))
+        elif isinstance(child, Tag) and child.name not in ("raw", "construct"):
+            node.elements.append(child)
+            node.texts.append(_ELEMENT)
+        else:
+            node.atomic = True
+            break
+    if not has_text:
+        node.texts = None
+    if node.name == "table" and not node.atomic:
+        rows = [e.name == "tr" for e in node.elements]
+        if all(rows) and rows:
+            node.tbody = True
+        elif any(rows):
+            # The structure of the DOM depends on how rows are grouped
+            node.atomic = True
+    return node
+
+
+def _html(tag):
+    return standard_html.to_string(tag)
+
+
+def diff(old, new):
+    """Return a list of operations that transform old's DOM into new's."""
+    if isinstance(old, ArenaNode):
+        old = old.materialize()
+    if isinstance(new, ArenaNode):
+        new = new.materialize()
+    blk = standard_html.block()
+    ops = []
+    # Each entry is (old tag, new tag, id, path)
+    to_diff = [(old, new, None, [])]
+    while to_diff:
+        o, n, base, path = to_diff.pop()
+        if o is n:
+            continue
+
+        onode = _normalize(o, blk)
+        nnode = _normalize(n, blk)
+
+        if (
+            onode.name != nnode.name
+            or onode.name == "inline"
+            or onode.atomic
+            or nnode.atomic
+            or onode.texts != nnode.texts
+            or onode.tbody != nnode.tbody
+        ):
+            if onode.name == "inline" or _html(o) != _html(n):
+                ops.append(
+                    {
+                        "op": "replace",
+                        "id": base,
+                        "path": path,
+                        "html": _html(n),
+                    }
+                )
+            continue
+
+        for k in {**onode.attributes, **nnode.attributes}:
+            value = nnode.attributes.get(k, None)
+            if onode.attributes.get(k, None) != value:
+                ops.append(
+                    {
+                        "op": "attr",
+                        "id": base,
+                        "path": path,
+                        "name": k,
+                        "value": "" if value is True else value,
+                    }
+                )
+
+        # Descendants of an element with an id that did not change are
+        # addressed relatively to that element
+        oid = onode.attributes.get("id", None)
+        if oid is not None and oid == nnode.attributes.get("id", None):
+            base, path = oid, []
+
+        if onode.tbody:
+            path = [*path, 0]
+
+        olds = onode.elements
+        news = nnode.elements
+        # Unchanged elements at both ends are skipped, and the remaining
+        # elements are compared pairwise
+        nprefix = 0
+        for oc, nc in zip(olds, news):
+            if oc != nc:
+                break
+            nprefix += 1
+        nsuffix = 0
+        for oc, nc in zip(reversed(olds[nprefix:]), reversed(news[nprefix:])):
+            if oc != nc:
+                break
+            nsuffix += 1
+
+        children = []
+        old_middle = olds[nprefix : len(olds) - nsuffix]
+        new_middle = news[nprefix : len(news) - nsuffix]
+        common = min(len(old_middle), len(new_middle))
+        for i in range(common):
+            children.append(
+                (old_middle[i], new_middle[i], base, [*path, nprefix + i])
+            )
+
+        # Children's operations are emitted after this element's insertions
+        # and removals, so their paths use the updated indexes
+        position = nprefix + common
+        for _ in old_middle[common:]:
+            ops.append({"op": "remove", "id": base, "path": [*path, position]})
+        for i, nc in enumerate(new_middle[common:]):
+            ops.append(
+                {
+                    "op": "insert",
+                    "id": base,
+                    "path": path,
+                    "index": position + i,
+                    "html": _html(nc),
+                }
+            )
+
+        to_diff.extend(reversed(children))
+
+    return ops
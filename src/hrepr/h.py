@@ -1,4 +1,6 @@
+import re
 from itertools import count
+from time import sleep
 from types import GeneratorType
 
 # Used by __str__, set by __init__ to avoid a circular dependency
@@ -7,8 +9,29 @@ standard_html = None
 current_id = count()
 
 
+def next_id():
+    """Return a new process-wide serial number."""
+    # next() on itertools.count is atomic, so no lock is needed
+    return next(current_id)
+
+
 def gensym(symbol):
-    return f"{symbol}__{next(current_id)}"
+    return f"{symbol}__{next_id()}"
+
+
+def bounded_setdefault(table, size, key, value):
+    """Insert value in table under key, unless the key is already present.
+
+    The oldest entries are dropped so that table holds at most size entries.
+    This is safe to call from several threads at once.
+    """
+    while len(table) >= size:
+        try:
+            table.pop(next(iter(table)), None)
+        except (RuntimeError, StopIteration):  # pragma: no cover
+            # The table was modified by another thread
+            pass
+    return table.setdefault(key, value)
 
 
 def flatten(seq):
@@ -21,6 +44,124 @@ def flatten(seq):
     return results
 
 
+def _has_generator(seq):
+    for element in seq:
+        if isinstance(element, GeneratorType):
+            return True
+        elif isinstance(element, (list, tuple)) and _has_generator(element):
+            return True
+    return False
+
+
+def _expand_generators(children):
+    # Generators can only be consumed once, so they are expanded right away
+    # instead of when the Tag is constructed, which may happen in several
+    # threads at the same time
+    if children and _has_generator(children):
+        return flatten(children)
+    return children
+
+
+def _snapshot(tag):
+    # Return (constructed, fields) for tag, where fields are the Tag's
+    # parent, name, attributes, classes, children, resources and serial
+    # (if it requires an id). While the Tag is constructed by a thread,
+    # _constructed is None, so fields read while it is False before and
+    # after are consistent.
+    while True:
+        state = tag._constructed
+        fields = (
+            tag._parent,
+            tag._name,
+            tag._attributes,
+            tag._classes,
+            tag._children,
+            tag._resources,
+            tag._serial if tag._require_id else None,
+        )
+        if state is not None and tag._constructed is state:
+            return state, fields
+        # Another thread is writing the fields
+        sleep(0)  # pragma: no cover
+
+
+def iflatten(seq):
+    for element in seq:
+        if isinstance(element, (list, tuple, GeneratorType)):
+            yield from iflatten(element)
+        else:
+            yield element
+
+
+def _apply_changes(node, trie):
+    if any(k is not None for k in trie):
+        if not isinstance(node, Tag):
+            raise TypeError(f"Cannot index into {type(node).__name__}")
+        n = len(node.children)
+        normalized = {}
+        for i, subtrie in trie.items():
+            if i is not None:
+                # Negative indexes count from the end, as for sequences
+                if i < 0:
+                    i += n
+                if not 0 <= i < n:
+                    raise IndexError("Path index out of range")
+                if i in normalized:
+                    raise ValueError("Several paths lead to the same node")
+            normalized[i] = subtrie
+        trie = normalized
+        children = []
+        for i, child in enumerate(node.children):
+            if i in trie:
+                new = _apply_changes(child, trie[i])
+                if isinstance(new, (list, tuple)):
+                    children.extend(new)
+                else:
+                    children.append(new)
+            else:
+                children.append(child)
+        node = type(node)(
+            name=node.name,
+            attributes=node.attributes,
+            children=tuple(children),
+            resources=node.resources,
+        )
+    fn = trie.get(None, None)
+    return node if fn is None else fn(node)
+
+
+def _class_list(cls):
+    if cls is None:
+        return ()
+    elif isinstance(cls, str):
+        return cls.split()
+    else:
+        return cls
+
+
+class Lazy:
+    """
+    Children that are only produced when the Tag is serialized:
+
+    >>> H.ul(Lazy(H.li(i) for i in range(1_000_000)))
+
+    The iterable is kept as it is in the Tag's children and consumed by the
+    serializer, so it can stream a large body without holding all of it in
+    memory. If it is an iterator, the Tag can only be serialized once.
+
+    Resources and J objects in lazy children are not collected, because
+    they are only seen after the rest of the page has been generated.
+    """
+
+    __slots__ = ("iterable",)
+
+    def __init__(self, iterable):
+        self.iterable = iterable
+
+    def __iter__(self):
+        return iflatten(self.iterable)
+
+
 class Tag:
     """
     Representation of an HTML tag.
@@ -64,10 +205,13 @@ class Tag:
         "_parent",
         "_name",
         "_attributes",
+        "_classes",
         "_children",
         "_resources",
         "_require_id",
         "_serial",
+        "_hash",
+        "_cache",
     )
 
     specialized_tags = {}
@@ -76,11 +220,13 @@ class Tag:
     def specialize(cls, name):
         """Return a new subclass specialized for the given tag name."""
         assert cls is Tag
-        if name not in cls.specialized_tags:
-            cls.specialized_tags[name] = type(
-                f"Tag::{name}", (Tag,), {"__slots__": ()}
+        rval = cls.specialized_tags.get(name, None)
+        if rval is None:
+            # If two threads get here, both use whichever class is set first
+            rval = cls.specialized_tags.setdefault(
+                name, type(f"Tag::{name}", (Tag,), {"__slots__": ()})
             )
-        return cls.specialized_tags[name]
+        return rval
 
     def __init__(
         self,
@@ -89,71 +235,107 @@ class Tag:
         attributes=None,
         children=None,
         resources=None,
+        classes=None,
     ):
+        # False, then None while a thread constructs the Tag, then True
         self._constructed = False
         self._parent = parent
         self._name = name
         self._attributes = attributes
+        self._classes = classes
+        self._hash = None
+        # Data derived from the constructed Tag, such as serialized HTML
+        self._cache = None
         self._children = children
         self._resources = resources
         self._require_id = False
-        self._serial = next(current_id)
-
-    def _do_cache(self):
-        self._constructed = True
-
-        sequence = [self]
+        self._serial = next_id()
+
+    def _construct(self):
+        # This runs without a lock, so several threads may construct the
+        # same Tag at once, which only wastes a little work, since they all
+        # write the same values.
+        parts = []
+        base = None
         current = self
-        while current._parent is not None:
-            sequence.append(current._parent)
-            current = current._parent
-        self._name = current._name
-
-        attributes = {}
-        children = []
-        resources = []
+        while current is not None:
+            constructed, fields = _snapshot(current)
+            if constructed:
+                if current is self:  # pragma: no cover
+                    # Constructed by another thread in the meantime
+                    return
+                # Already merged with its own parents and flattened
+                base = fields
+                break
+            parts.append(fields)
+            current = fields[0]
+
+        if base is None:
+            name = parts[-1][1]
+            attributes = {}
+            children = []
+            resources = []
+        else:
+            name = base[1]
+            attributes = dict(base[2])
+            children = list(base[4])
+            resources = list(base[5])
         serial = None
 
-        for part in reversed(sequence):
-            if part._require_id:
-                serial = part._serial
-            if part._attributes:
-                attributes.update(part._attributes)
-            if part._children:
-                children.extend(part._children)
-            if part._resources:
-                resources.extend(part._resources)
+        for _, _, attrs, classes, kids, res, required in reversed(parts):
+            if required is not None:
+                serial = required
+            if attrs:
+                attributes.update(attrs)
+            if classes:
+                existing = attributes.get("class", None) or ()
+                if isinstance(existing, str):
+                    existing = (existing,)
+                attributes["class"] = (*existing, *classes)
+            if kids:
+                children.extend(flatten(kids))
+            if res:
+                resources.extend(res)
 
         if serial is not None and "id" not in attributes:
             attributes["id"] = f"H{serial}"
 
-        self._parent = None
+        if self._constructed is not False:  # pragma: no cover
+            # Another thread got there first
+            _snapshot(self)
+            return
+        self._constructed = None
+        self._name = name
         self._attributes = attributes
-        self._children = tuple(flatten(children))
+        self._classes = None
+        self._children = tuple(children)
         self._resources = tuple(resources)
+        # Release the parent chain
+        self._parent = None
+        self._constructed = True
 
     @property
     def name(self):
-        if not self._constructed:
-            self._do_cache()
+        if self._constructed is not True:
+            self._construct()
         return self._name
 
     @property
     def attributes(self):
-        if not self._constructed:
-            self._do_cache()
+        if self._constructed is not True:
+            self._construct()
         return self._attributes
 
     @property
     def children(self):
-        if not self._constructed:
-            self._do_cache()
+        if self._constructed is not True:
+            self._construct()
         return self._children
 
     @property
     def resources(self):
-        if not self._constructed:  # pragma: no cover
-            self._do_cache()
+        if self._constructed is not True:  # pragma: no cover
+            self._construct()
         return self._resources
 
     def fill(self, children=None, attributes=None, resources=None):
@@ -162,7 +344,7 @@ class Tag:
         return type(self)(
             parent=self,
             attributes=attributes,
-            children=children,
+            children=_expand_generators(children),
             resources=resources,
         )
 
@@ -170,34 +352,196 @@ class Tag:
         return self.attributes.get(attr, dflt)
 
     def ensure_id(self):
-        if self._require_id or (
-            self._attributes and self._attributes.get("id", None)
-        ):
-            return self
-        elif self._constructed:
-            raise Exception(
-                "It is too late to ensure that this node has an ID, because"
-                " its attributes or children have already been accessed."
-                " Either construct with an explicit id, or call ensure_id() earlier."
-            )
-        else:
-            self._require_id = True
-            return self
+        if self._constructed is False:
+            if not self._require_id:
+                attributes = self._attributes
+                if not (attributes and attributes.get("id", None)):
+                    self._require_id = True
+            if self._constructed is False:
+                return self
+        if "id" not in self.attributes:
+            self._too_late()
+        return self
+
+    def _too_late(self):
+        raise Exception(
+            "It is too late to ensure that this node has an ID, because"
+            " its attributes or children have already been accessed."
+            " Either construct with an explicit id, or call ensure_id() earlier."
+        )
 
     @property
     def id(self):
-        self.ensure_id()
-        return self.attributes["id"]
+        attributes = self.ensure_id().attributes
+        if "id" not in attributes:  # pragma: no cover
+            # Constructed by another thread while ensure_id was running
+            self._too_late()
+        return attributes["id"]
+
+    def walk(self, paths=False):
+        """Iterate over this Tag and its descendant Tags, in document order.
+
+        If paths is True, yield (path, tag) pairs, where path is the tuple
+        of child indexes that leads from this Tag to tag.
+        """
+        to_visit = [((), self)]
+        while to_visit:
+            path, tag = to_visit.pop()
+            yield (path, tag) if paths else tag
+            to_visit.extend(
+                ((*path, i), child)
+                for i, child in reversed(list(enumerate(tag.children)))
+                if isinstance(child, Tag)
+            )
+
+    def update(self, changes):
+        """Return a new Tag with changes applied at several paths at once.
+
+        Arguments:
+            changes: A dict that maps paths (tuples of child indexes, as
+                produced by walk(paths=True), where negative indexes count
+                from the end) to functions. Each function
+                takes the node at that path and returns its replacement.
+                If it returns a list or tuple, its elements replace the
+                node, so returning an empty tuple removes it.
+
+        All paths refer to this Tag. If both a node and one of its
+        descendants change, the descendant's change is applied first. Only
+        the ancestors of the changed nodes are rebuilt: every other subtree
+        is shared with this Tag.
+        """
+        trie = {}
+        for path, fn in changes.items():
+            node = trie
+            for i in path:
+                node = node.setdefault(i, {})
+            node[None] = fn
+        result = _apply_changes(self, trie)
+        if not isinstance(result, Tag):
+            raise ValueError("The root Tag must be replaced by a single Tag.")
+        return result
+
+    def replace(self, path, new):
+        """Return a new Tag where the node at path is replaced by new."""
+        return self.update({tuple(path): lambda node: new})
+
+    def wrap(self, path, wrapper):
+        """Return a new Tag where the node at path is wrapped.
+
+        The wrapper is called with the node, so it can be a Tag such as
+        ``H.div["box"]``, or a function.
+        """
+        return self.update({tuple(path): wrapper})
+
+    def remove(self, path):
+        """Return a new Tag without the node at path."""
+        return self.update({tuple(path): lambda node: ()})
+
+    def _index(self):
+        # Map ("name", name), ("id", id) and ("class", class) to the lists
+        # of matching descendants, in document order
+        if self._cache is not None and "index" in self._cache:
+            return self._cache["index"]
+        index = {}
+        for tag in self.walk():
+            attributes = tag.attributes
+            keys = [("name", tag.name)]
+            if (tid := attributes.get("id", None)) is not None:
+                keys.append(("id", tid))
+            for cls in _class_list(attributes.get("class", None)):
+                keys.append(("class", cls))
+            for key in keys:
+                index.setdefault(key, []).append(tag)
+        if self._cache is None:
+            self._cache = {}
+        return self._cache.setdefault("index", index)
+
+    def _query(self, name, id, class_, predicate):
+        classes = [class_] if isinstance(class_, str) else list(class_ or ())
+        keys = [
+            *([("name", name)] if name is not None else []),
+            *([("id", id)] if id is not None else []),
+            *[("class", cls) for cls in classes],
+        ]
+        if keys:
+            index = self._index()
+            candidates = min(
+                (index.get(key, ()) for key in keys),
+                key=len,
+            )
+            keys = set(keys)
+        else:
+            candidates = self.walk()
+
+        def matches(tag):
+            if keys:
+                attributes = tag.attributes
+                tag_keys = {
+                    ("name", tag.name),
+                    ("id", attributes.get("id", None)),
+                    *[
+                        ("class", cls)
+                        for cls in _class_list(attributes.get("class", None))
+                    ],
+                }
+                if not keys <= tag_keys:
+                    return False
+            return predicate is None or predicate(tag)
+
+        return filter(matches, candidates)
+
+    def find_all(self, name=None, *, id=None, class_=None, predicate=None):
+        """Return the Tags in this tree that match every given criterion.
+
+        Arguments:
+            name: The tag name.
+            id: The id attribute.
+            class_: A class, or a list of classes that must all be present.
+            predicate: A function that takes a Tag and returns whether it
+                matches.
+
+        Lookups by name, id or class use an index that is built on the first
+        query and kept for the next ones, since the Tag is immutable.
+        """
+        return list(self._query(name, id, class_, predicate))
+
+    def find(self, name=None, *, id=None, class_=None, predicate=None):
+        """Return the first Tag in this tree that matches, or None.
+
+        The arguments are the same as for find_all.
+        """
+        return next(self._query(name, id, class_, predicate), None)
+
+    def select(self, selector):
+        """Return the Tags in this tree that match a simple CSS selector.
+
+        The selector is a tag name, followed by any number of ``#id`` and
+        ``.class`` parts, for example ``"div.hrepr-body"``, ``".hrepr-ref"``
+        or ``"span#main.big"``. Combinators are not supported.
+        """
+        name = id = None
+        classes = []
+        for part in re.findall(pattern=r"[#.]?[^#.]+", string=selector):
+            if part.startswith("#"):
+                id = part[1:]
+            elif part.startswith("."):
+                classes.append(part[1:])
+            else:
+                name = part
+        return self.find_all(name, id=id, class_=classes)
+
+    def builder(self):
+        """Return a TagBuilder to add many children to this Tag at once."""
+        return TagBuilder(self)
 
     def __getitem__(self, items):
         if not isinstance(items, tuple):
             items = (items,)
         assert all(isinstance(item, str) for item in items)
-        attributes = {}
-        classes = [it for it in items if not it.startswith("#")]
-        if classes:
-            attributes["class"] = (*self.attributes.get("class", ()), *classes)
-        return self.fill(attributes=attributes)
+        classes = tuple(it for it in items if not it.startswith("#"))
+        # The classes are merged with the parent's when the Tag is
+        # constructed, so this does not force the parent's construction
+        return type(self)(parent=self, classes=classes)
 
     def __call__(self, *children, resources=None, id=None, **attributes):
         attributes = {
@@ -216,23 +560,50 @@ class Tag:
         return result
 
     def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, Tag):
+            return False
+        if (
+            self._hash is not None
+            and other._hash is not None
+            and self._hash != other._hash
+        ):
+            return False
         return (
-            isinstance(other, Tag)
-            and self.name == other.name
+            self.name == other.name
             and self.attributes == other.attributes
             and self.children == other.children
             and self.resources == other.resources
         )
 
     def __hash__(self):
-        return hash(
-            (
-                self.name,
-                tuple(self.attributes.items()),
-                self.children,
-                self.resources,
+        # Tags are immutable once constructed, so the hash can be cached
+        if self._hash is None:
+            self._hash = hash(
+                (
+                    self.name,
+                    # Attribute order does not matter for equality
+                    frozenset(self.attributes.items()),
+                    self.children,
+                    self.resources,
+                )
             )
-        )
+        return self._hash
+
+    def __copy__(self):
+        # Tags are immutable, so copies can share them. This also keeps
+        # copy from using __reduce__, which only works for Tags that can be
+        # serialized.
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        from .serial import dumps, loads
+
+        return (loads, (dumps(self),))
 
     def __repr__(self):
         return str(self)
@@ -246,11 +617,59 @@ class Tag:
         """
         return standard_html.to_jupyter(self)
 
-    def as_page(self):
+    def as_page(self, assets=None, bundle=False, lazy=None):
         """
-        Wrap this Tag as a self-contained webpage.
+        Wrap this Tag as a webpage. See HTMLGenerator.as_page.
         """
-        return standard_html.as_page(self)
+        return standard_html.as_page(
+            self, assets=assets, bundle=bundle, lazy=lazy
+        )
+
+
+class TagBuilder:
+    """
+    Accumulate children, attributes and classes for a Tag, and create the
+    resulting Tag in a single step:
+
+    >>> builder = H.ul.builder()
+    >>> for i in range(3):
+    ...     builder.append(H.li(i))
+    >>> builder.add_class("numbers")
+    >>> builder.build()
+    <ul class="numbers"><li>0</li><li>1</li><li>2</li></ul>
+    """
+
+    def __init__(self, tag):
+        self.tag = tag
+        self.attributes = {}
+        self.classes = []
+        self.children = []
+        self.resources = []
+
+    def append(self, *children):
+        self.children.extend(children)
+
+    def extend(self, children):
+        self.children.extend(children)
+
+    def add_class(self, *classes):
+        self.classes.extend(classes)
+
+    def set(self, **attributes):
+        for attr, value in attributes.items():
+            self.attributes[attr.replace("_", "-")] = value
+
+    def add_resources(self, *resources):
+        self.resources.extend(resources)
+
+    def build(self):
+        return type(self.tag)(
+            parent=self.tag,
+            attributes=dict(self.attributes),
+            classes=tuple(self.classes),
+            children=_expand_generators(list(self.children)),
+            resources=tuple(self.resources),
+        )
 
 
 class HTML:
@@ -279,8 +698,7 @@ class HTML:
             rval = tag_class(name=tag_name)
         else:
             rval = tag_class  # pragma: no cover
-        setattr(self, tag_name, rval)
-        return rval
+        return self.__dict__.setdefault(tag_name, rval)
 
 
 H = HTML(tag_class=Tag, instantiate=True)
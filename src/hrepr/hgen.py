@@ -1,22 +1,49 @@
+import io
 import json
 import re
 from collections import deque
 from dataclasses import dataclass, field
-from html import escape
-from pathlib import Path
+from functools import cached_property, lru_cache
+from html import escape as html_escape
+from itertools import chain, islice
 from typing import Callable, Optional, Union
 
 from ovld import OvldBase, recurse
 from ovld.dependent import Code, ParametrizedDependentType
 
 from . import resource
-from .h import H, Tag, gensym
+from .arena import ArenaNode
+from .h import H, Lazy, Tag, bounded_setdefault, gensym
 from .j import CodeWrapper, J, Returns
 from .textgen import Breakable, Sequence, Text, TextFormatter, join
 
-here = Path(__file__).parent
-constructor_lib = H.script((here / "hlib.js").read_text())
-css_nbreset = H.style((here / "style/nbreset.css").read_text())
+_assets = {
+    "constructor_lib": ("script", "hlib.js"),
+    "css_nbreset": ("style", "style", "nbreset.css"),
+}
+
+
+@lru_cache(maxsize=None)
+def _asset_tag(tag_name, *path):
+    return getattr(H, tag_name)(resource.read_asset(*path))
+
+
+def __getattr__(name):
+    # constructor_lib and css_nbreset are only read when they are needed
+    if name in _assets:
+        return _asset_tag(*_assets[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _asset_directory(assets):
+    if assets is None:
+        return None
+    # Only imported when assets are used, since it imports tempfile
+    from .assets import AssetDirectory
+
+    if isinstance(assets, AssetDirectory):
+        return assets
+    return AssetDirectory(assets)
 
 
 class HasNodeName(ParametrizedDependentType):
@@ -61,6 +88,170 @@ _void_tags = {
     "!DOCTYPE",
 }
 
+# Tags that are not written directly from an Arena's arrays
+_arena_special_tags = {"script", "style", "raw", "construct"}
+
+# Longest HTML that is cached on a Tag by cached_node_embed
+_cached_html_max_length = 1 << 16
+
+# Serialized attributes, keyed by block generator class and attributes
+_attribute_cache = {}
+_attribute_cache_size = 4096
+
+# Attribute values for which attr_embed only depends on the value
+_plain_attribute_types = {str, int, float, bool, type(None)}
+
+# Attribute values that may be modified after the Tag is serialized
+_mutable_attribute_types = {list, dict, set}
+
+
+# Sources of scripts and JSExpressions split at resource placeholders
+_placeholder_cache = {}
+_placeholder_cache_size = 1024
+
+# Longer sources are split every time, so the cache holds at most about
+# _placeholder_cache_size * _placeholder_cache_max_length characters
+_placeholder_cache_max_length = 4096
+
+
+@lru_cache(maxsize=8)
+def _placeholder_pattern(key):
+    return re.compile(rf"\[{key}:([0-9]+)\]")
+
+
+def _placeholders(text, cache=True):
+    """Split text at the placeholders for resources.
+
+    Return a tuple of strings at even indexes, and resource ids at odd
+    indexes. The result is cached unless cache is False or the text is
+    longer than _placeholder_cache_max_length.
+    """
+    cache = cache and len(text) <= _placeholder_cache_max_length
+    key = (resource.embed_key, text)
+    if cache:
+        try:
+            return _placeholder_cache[key]
+        except KeyError:
+            pass
+    parts = _placeholder_pattern(resource.embed_key).split(text)
+    parts[1::2] = map(int, parts[1::2])
+    parts = tuple(parts)
+    if not cache:
+        return parts
+    return bounded_setdefault(
+        _placeholder_cache, _placeholder_cache_size, key, parts
+    )
+
+
+def escape(s):
+    """html.escape, with a fast path for strings that need no escaping."""
+    if "&" in s or "<" in s or ">" in s or '"' in s or "'" in s:
+        return html_escape(s)
+    return s
+
+
+def _attribute_key(attributes):
+    # Return a key for the attributes, or None if they should not be cached
+    key = []
+    for k, v in attributes.items():
+        t = type(v)
+        if t is tuple or t is list:
+            if not all(type(x) is str for x in v):
+                return None
+            v = tuple(v)
+        elif t not in _plain_attribute_types:
+            return None
+        # The type is part of the key because True == 1
+        key.append((k, t, v))
+    return tuple(key)
+
+
+class Deferred:
+    """Children of a node, which are embedded as the output is written."""
+
+    __slots__ = ("embed", "children")
+
+    def __init__(self, embed, children):
+        self.embed = embed
+        self.children = children
+
+    def __iter__(self):
+        return map(self.embed, self.children)
+
+
+class LazyText(Breakable):
+    """Output produced from Lazy children, only when it is written."""
+
+
+_done = object()
+
+
+def write_text(fmt, emit, lazy=True):
+    """Call emit with each string in fmt, in order.
+
+    The TextFormatter tree is walked iteratively and Deferred children are
+    embedded as they are reached, so no intermediate strings are built and
+    deep trees do not hit the recursion limit. If lazy is False, LazyText
+    parts are passed to emit as they are instead of being written.
+    """
+    stack = [iter((fmt,))]
+    while stack:
+        x = next(stack[-1], _done)
+        if x is _done:
+            stack.pop()
+        elif isinstance(x, str):
+            emit(x)
+        elif isinstance(x, Text):
+            emit(x.value)
+        elif isinstance(x, LazyText) and not lazy:
+            emit(x)
+        elif isinstance(x, Breakable):
+            stack.append(
+                chain(
+                    () if x.start is None else (x.start,),
+                    x.body,
+                    () if x.end is None else (x.end,),
+                )
+            )
+        elif isinstance(x, Sequence):
+            stack.append(iter(x.elements))
+        else:
+            emit(str(x))
+
+
+class ChunkWriter:
+    """Buffer strings and write them to fp in chunks of about flush_every
+    characters. Binary files receive UTF-8.
+    """
+
+    def __init__(self, fp, flush_every):
+        self.fp = fp
+        self.flush_every = flush_every
+        mode = getattr(fp, "mode", None)
+        self.binary = isinstance(fp, (io.RawIOBase, io.BufferedIOBase)) or (
+            isinstance(mode, str) and "b" in mode
+        )
+        self.parts = []
+        self.size = 0
+
+    def write(self, s):
+        self.parts.append(s)
+        self.size += len(s)
+        if self.size >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        data = "".join(self.parts)
+        self.parts.clear()
+        self.size = 0
+        if data:
+            self.fp.write(data.encode("utf8") if self.binary else data)
+
+
+# Pages larger than this are spooled to disk while their resources are
+# collected
+_spool_size = 1 << 22
+
 
 @dataclass
 class ScriptAccumulator:
@@ -71,6 +262,43 @@ class ScriptAccumulator:
     styles: list = field(default_factory=list)
 
 
+@dataclass
+class ScriptBundle:
+    """Scripts of all the J objects in a page, to write as a single module.
+
+    Each J object is an entry in a table of constructors given to
+    $$HREPR.runAll, which runs them in order, isolating errors as separate
+    scripts would. Modules are imported once.
+    """
+
+    # Map (module, symbol) to the name the symbol is imported as
+    imports: dict = field(default_factory=dict)
+    ids: list = field(default_factory=list)
+    entries: list = field(default_factory=list)
+
+    def import_name(self, module, symbol):
+        key = (module, symbol)
+        if key not in self.imports:
+            self.imports[key] = gensym(symbol or "default")
+        return self.imports[key]
+
+    def scripts(self, blk):
+        if not self.entries:
+            return []
+        lines = []
+        for (module, symbol), varname in self.imports.items():
+            if symbol:
+                line = f"import {{ {symbol} as {varname} }} from {blk.js_embed(module)};"
+            else:
+                line = f"import {varname} from {blk.js_embed(module)};"
+            lines.append(line)
+        lines += ["$$HREPR.runAll([", ",\n".join(self.entries), "]);"]
+        return [
+            H.script(f"$$HREPR.prepareAll({blk.js_embed(self.ids)});"),
+            H.script("\n".join(lines), type="module"),
+        ]
+
+
 @dataclass
 class BlockGenerator(OvldBase):
     global_generator: "HTMLGenerator"
@@ -81,6 +309,16 @@ class BlockGenerator(OvldBase):
     extra: deque = field(default_factory=deque)
     processed_resources: list = None
     processed_extra: list = None
+    # If set, the scripts of J objects are collected in it
+    bundle: Optional[ScriptBundle] = None
+    # When to create J objects that do not specify it ("visible" or "idle"),
+    # or None to create them on load
+    lazy: Optional[str] = None
+    # False if the output may differ from one serialization to the next
+    cacheable: bool = True
+    # Registries found in the resources of the Tags, where the Resources
+    # they embed are looked up
+    registries: list = field(default_factory=list)
 
     #############
     # Utilities #
@@ -88,38 +326,246 @@ class BlockGenerator(OvldBase):
 
     @property
     def constructor_lib(self):
-        return constructor_lib
+        return _asset_tag(*_assets["constructor_lib"])
 
     def expand_resources(self, value, embed):
-        def sub(m):
-            res = resource.registry.resolve(int(m.groups()[0]))
-            return self.expand_resources(embed(res.obj), embed)
-
-        return re.sub(
-            pattern=rf"\[{resource.embed_key}:([0-9]+)\]",
-            string=str(value),
-            repl=sub,
-        )
+        """Replace the placeholders for resources in value.
 
-    def represent_node_generic(
-        self, node, open=None, close=None, node_embed=None
-    ):
-        self.resources.extend(node.resources)
+        Each resource is embedded with embed, and placeholders found in the
+        result are expanded as well. The text is scanned once, and so is
+        the embedding of each resource.
+        """
+        text = str(value)
+        marker = f"[{resource.embed_key}:"
+        if marker not in text:
+            return text
+        # Resources may be mutable objects
+        self.cacheable = False
+        out = []
+        # Resources whose embedding is being expanded
+        active = set()
+        # Entries are (parts, index of the next part, id of the resource
+        # the parts come from)
+        stack = [(_placeholders(text), 0, None)]
+        while stack:
+            parts, i, rid = stack.pop()
+            if i == len(parts):
+                active.discard(rid)
+                continue
+            stack.append((parts, i + 1, rid))
+            if i % 2 == 0:
+                out.append(parts[i])
+                continue
+            res_id = parts[i]
+            if res_id in active:
+                raise ValueError(f"Resource {res_id} is embedded in itself.")
+            sub = str(embed(self.resolve_resource(res_id).obj))
+            if marker in sub:
+                active.add(res_id)
+                stack.append((_placeholders(sub, cache=False), 0, res_id))
+            else:
+                out.append(sub)
+        return "".join(out)
+
+    def resolve_resource(self, res_id):
+        for registry in self.registries:
+            res = registry.id_to_resource.get(res_id, None)
+            if res is not None:
+                return res
+        return resource.current_registry().resolve(res_id)
+
+    def add_resources(self, resources):
+        for res in resources:
+            if isinstance(res, resource.Registry):
+                self.registries.append(res)
+            else:
+                self.resources.append(res)
 
-        open = node.name if open is None else open
-        close = (node.name not in _void_tags) if close is None else close
+    def cache_key(self):
+        return ("html", type(self), self.hrepr)
 
-        node_embed = node_embed or self.node_embed
+    def expand(self, fmt):
+        """Embed all the Deferred children in fmt.
+
+        This must be done before the resources and extra scripts of the
+        block are processed, since embedding a node collects them. The
+        result is a Text, unless there are Lazy children, in which case it
+        is a Breakable that contains the corresponding LazyText.
+        """
+        if isinstance(fmt, str):
+            return fmt
+
+        parts = []
+        pending = []
+
+        def emit(x):
+            if isinstance(x, str):
+                pending.append(x)
+            else:
+                parts.append("".join(pending))
+                pending.clear()
+                parts.append(x)
+
+        write_text(fmt, emit, lazy=False)
+        if not parts:
+            return Text("".join(pending))
+        parts.append("".join(pending))
+        return Breakable(start=None, body=parts, end=None)
+
+    def cached_node_embed(self, node):
+        """Embed node, and cache the resulting HTML if it is a Tag.
+
+        Tags are immutable, so the HTML can be reused the next time the Tag
+        is serialized, either alone or inside another Tag. It is not cached
+        if it depends on objects that may change, if it produced extra
+        scripts, or if it is longer than _cached_html_max_length, so that
+        large documents are not kept in memory twice.
+        """
+        if not isinstance(node, Tag):
+            return self.expand(self.node_embed(node))
+        cacheable, self.cacheable = self.cacheable, True
+        nresources = len(self.resources)
+        nextra = len(self.extra)
+        result = self.expand(self.node_embed(node))
+        if (
+            self.cacheable
+            and len(self.extra) == nextra
+            and isinstance(result, Text)
+            and len(result.value) <= _cached_html_max_length
+        ):
+            if node._cache is None:
+                node._cache = {}
+            node._cache[self.cache_key()] = (
+                result.value,
+                tuple(islice(self.resources, nresources, None)),
+            )
+        self.cacheable = cacheable and self.cacheable
+        return result
+
+    def process_extra(self):
+        if self.bundle is not None:
+            self.extra.extend(self.bundle.scripts(self))
+            self.bundle = None
+        proc = []
+        while self.extra:
+            proc.append(self.expand(self.node_embed(self.extra.popleft())))
+        return proc
 
-        attributes = {k: self.attr_embed(v) for k, v in node.attributes.items()}
+    def process_resources(self, seen, assets=None):
+        """Embed the resources that are not in seen, and add them to it.
 
-        attr = "".join(
+        If assets is an AssetDirectory, stylesheets and scripts are written
+        to it and the result refers to them.
+        """
+        proc = []
+        while self.resources:
+            nxt = self.resources.popleft()
+            if nxt not in seen:
+                seen.add(nxt)
+                if assets is not None:
+                    nxt = assets.externalize(nxt, self)
+                proc.append(self.cached_node_embed(nxt))
+        return proc
+
+    def attribute_string(self, attributes):
+        """Serialize attributes, reusing the result for common attributes.
+
+        Most nodes have a few attributes with simple values, like classes,
+        and the same combinations are used over and over.
+        """
+        if not attributes:
+            return ""
+        if any(
+            type(v) in _mutable_attribute_types for v in attributes.values()
+        ):
+            # The HTML of the Tag cannot be cached
+            self.cacheable = False
+        key = _attribute_key(attributes)
+        if key is None:
+            return self._attribute_string(attributes)
+        key = (type(self), key)
+        try:
+            return _attribute_cache[key]
+        except KeyError:
+            pass
+        return bounded_setdefault(
+            _attribute_cache,
+            _attribute_cache_size,
+            key,
+            self._attribute_string(attributes),
+        )
+
+    def _attribute_string(self, attributes):
+        attributes = {k: self.attr_embed(v) for k, v in attributes.items()}
+        return "".join(
             f" {k}" if v is True else f' {k}="{escape(v)}"'
             for k, v in attributes.items()
             if v is not None and v is not False
         )
 
-        children = list(map(node_embed, node.children))
+    def represent_arena_node(self, node):
+        # Write the node directly from the arena's arrays, without creating
+        # intermediate objects for each node
+        arena = node.arena
+        parts = []
+        # Entries are node indexes (>= 0), value references (< 0), or
+        # strings to write as they are
+        stack = [node.index]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                parts.append(item)
+                continue
+            elif item < 0:
+                value = arena.values[~item]
+                if isinstance(value, str):
+                    parts.append(escape(value))
+                else:
+                    parts.append(str(self.expand(self.node_embed(value))))
+                continue
+
+            name = arena.name(item)
+            if name in _arena_special_tags:
+                parts.append(
+                    str(self.expand(self.node_embed(arena.materialize(item))))
+                )
+                continue
+
+            self.add_resources(arena.resources.get(item, ()))
+            refs = arena.refs(item)
+            if name == "inline":
+                stack.extend(reversed(refs))
+                continue
+
+            attr = self.attribute_string(arena.attributes(item))
+            if name in _void_tags:
+                assert not refs
+                parts.append(f"<{name}{attr} />")
+            else:
+                parts.append(f"<{name}{attr}>")
+                stack.append(f"</{name}>")
+                stack.extend(reversed(refs))
+
+        return Text("".join(parts))
+
+    def represent_node_generic(
+        self, node, open=None, close=None, node_embed=None
+    ):
+        if node._cache is not None:
+            cached = node._cache.get(self.cache_key(), None)
+            if cached is not None:
+                text, resources = cached
+                self.resources.extend(resources)
+                return Text(text)
+
+        self.add_resources(node.resources)
+
+        open = node.name if open is None else open
+        close = (node.name not in _void_tags) if close is None else close
+
+        node_embed = node_embed or self.node_embed
+        attr = self.attribute_string(node.attributes)
+        children = Deferred(node_embed, node.children)
 
         if open:
             if close:
@@ -129,7 +575,7 @@ class BlockGenerator(OvldBase):
                     end=f"</{open}>",
                 )
             else:
-                assert not children
+                assert not node.children
                 return Text(f"<{open}{attr} />")
         else:
             return Breakable(start=None, body=children, end=None)
@@ -188,8 +634,19 @@ class BlockGenerator(OvldBase):
     def node_embed(self, node: Tag):
         return self.represent_node_generic(node=node)
 
+    def node_embed(self, node: Lazy):
+        # The children are embedded as the result is converted to a string
+        self.cacheable = False
+        return LazyText(
+            start=None, body=Deferred(self.node_embed, node), end=None
+        )
+
+    def node_embed(self, node: ArenaNode):
+        return self.represent_arena_node(node)
+
     def node_embed(self, node: J):
         assert not self.script_accumulator
+        self.cacheable = False
         self.script_accumulator = ScriptAccumulator()
 
         embedded = self.js_embed(node)
@@ -218,18 +675,39 @@ class BlockGenerator(OvldBase):
             element = element(**node._model_attributes)
 
         async_txt = "async " if node._is_async() else ""
-        lines = [
-            f"$$HREPR.run({self.js_embed(list(set(self.script_accumulator.scripts)))},'#{wid}',{async_txt}()=>{{",
-            *lines,
-            replace_line,
-            "});",
-        ]
-
-        self.extra.append(H.script(f"$$HREPR.prepare({self.js_embed(wid)});"))
-
+        lazy = node._data.lazy
+        if lazy is None:
+            lazy = self.lazy
         into_line = (
             f"const $$INTO = document.getElementById({self.js_embed(wid)});"
         )
+
+        if self.bundle is not None:
+            scripts = self.js_embed(list(set(self.script_accumulator.scripts)))
+            body = "\n".join([into_line, *lines, replace_line])
+            lazy_txt = f",{self.js_embed(lazy)}" if lazy else ""
+            entry = (
+                f"[{scripts},'#{wid}',{async_txt}()=>{{\n{body}\n}}{lazy_txt}]"
+            )
+            self.bundle.ids.append(wid)
+            self._add_accumulated_resources()
+            self.script_accumulator = None
+            result = self.expand(recurse(element))
+            self.bundle.entries.append(entry)
+            return result
+
+        run_txt = f"$$HREPR.run({self.js_embed(list(set(self.script_accumulator.scripts)))},'#{wid}',{async_txt}()=>{{"
+        end_txt = "});"
+        if lazy:
+            # Defer the call to run until the element is visible
+            run_txt = (
+                f"$$HREPR.lazy({self.js_embed(lazy)},'#{wid}',()=>{run_txt}"
+            )
+            end_txt = "}));"
+        lines = [run_txt, *lines, replace_line, end_txt]
+
+        self.extra.append(H.script(f"$$HREPR.prepare({self.js_embed(wid)});"))
+
         lines = [into_line, *lines]
 
         for module, symbol, varname in self.script_accumulator.modules:
@@ -239,6 +717,16 @@ class BlockGenerator(OvldBase):
                 line = f"import {varname} from {self.js_embed(module)};"
             lines = [line, *lines]
 
+        self._add_accumulated_resources()
+        self.script_accumulator = None
+
+        # Expand now, so that the extra scripts of J objects inside the
+        # element come before this one
+        result = self.expand(recurse(element))
+        self.extra.append(H.script("\n".join(lines), type="module"))
+        return result
+
+    def _add_accumulated_resources(self):
         for code in self.script_accumulator.codes:
             self.resources.append(H.script(code))
 
@@ -248,16 +736,12 @@ class BlockGenerator(OvldBase):
         if clib := self.constructor_lib:
             self.resources.append(clib)
 
-        self.script_accumulator = None
-
-        result = recurse(element)
-        self.extra.append(H.script("\n".join(lines), type="module"))
-        return result
-
     def node_embed(self, node: type(None)):
         return ""
 
     def node_embed(self, node: object):
+        # The object may change between serializations
+        self.cacheable = False
         if hasattr(node, "__h__"):
             return recurse(node.__h__())
         elif self.hrepr:
@@ -305,6 +789,7 @@ class BlockGenerator(OvldBase):
 
     def attr_embed(self, x: object):
         if hasattr(x, "__attr_embed__"):
+            self.cacheable = False
             return x.__attr_embed__(self)
         else:
             raise TypeError(
@@ -367,7 +852,12 @@ class BlockGenerator(OvldBase):
                 ]
             )
         if jd.namespace is not None:
-            varname = gensym(symbol)
+            if self.bundle is not None:
+                varname = self.bundle.import_name(
+                    jd.namespace, None if symbol == "default" else symbol
+                )
+            else:
+                varname = gensym(symbol)
             self.script_accumulator.modules.append(
                 (
                     jd.namespace,
@@ -434,24 +924,47 @@ class BlockGenerator(OvldBase):
 
 class HTMLGenerator:
     def __init__(self, block_generator_class=BlockGenerator, hrepr=None):
-        self.seen_resources = set()
         self.block_generator_class = block_generator_class
         self.hrepr = hrepr
 
+    # The session module is only imported when sessions are used
+
+    @cached_property
+    def seen_resources(self):
+        """Resources delivered by __call__ when no session is given."""
+        from .session import ResourceSession
+
+        return ResourceSession()
+
+    @cached_property
+    def sessions(self):
+        from .session import SessionStore
+
+        return SessionStore()
+
     def block(self):
         return self.block_generator_class(
             global_generator=self, hrepr=self.hrepr
         )
 
-    def blockgen(self, node, *, seen_resources=None, process_extra=True):
+    def blockgen(
+        self,
+        node,
+        *,
+        seen_resources=None,
+        process_extra=True,
+        assets=None,
+        bundle=False,
+        lazy=None,
+    ):
         blk = self.block()
-        blk.result = blk.node_embed(node)
+        blk.lazy = lazy
+        if bundle:
+            blk.bundle = ScriptBundle()
+        blk.result = blk.cached_node_embed(node)
 
         if process_extra:
-            blk.processed_extra = proc = []
-            while blk.extra:
-                nxt = blk.extra.popleft()
-                proc.append(blk.node_embed(nxt))
+            blk.processed_extra = blk.process_extra()
 
         if seen_resources is not True:
             seen = (
@@ -459,31 +972,106 @@ class HTMLGenerator:
                 if seen_resources is None
                 else seen_resources
             )
-            blk.processed_resources = proc = []
-            while blk.resources:
-                nxt = blk.resources.popleft()
-                if nxt not in seen:
-                    proc.append(blk.node_embed(nxt))
-                    seen.add(nxt)
+            blk.processed_resources = blk.process_resources(seen, assets)
 
         return blk
 
     def to_string(self, node):
-        return str(self.blockgen(node, seen_resources=True).result)
+        parts = []
+        with resource.scope():
+            write_text(
+                self.blockgen(node, seen_resources=True).result, parts.append
+            )
+        return "".join(parts)
 
-    def to_jupyter(self, node):  # pragma: no cover
-        blk = self.blockgen(node, seen_resources=set())
-        elem = H.div(
-            css_nbreset,
-            blk.processed_resources,
-            H.div["hrepr"](blk.result, blk.processed_extra),
+    def write(self, node, fp, flush_every=1 << 16):
+        """Write the same HTML as to_string(node) to a file-like object.
+
+        The HTML is written as it is generated, in chunks of about
+        flush_every characters, so it is never held in memory as a whole.
+        This works best with Lazy children. fp may be opened in text or
+        binary mode, in which case the HTML is encoded as UTF-8.
+        """
+        writer = ChunkWriter(fp, flush_every)
+        with resource.scope():
+            write_text(self.block().node_embed(node), writer.write)
+        writer.flush()
+
+    def write_page(
+        self,
+        node,
+        fp,
+        flush_every=1 << 16,
+        assets=None,
+        bundle=False,
+        lazy=None,
+        end="",
+    ):
+        """Write the same HTML as as_page(node, assets, bundle, lazy) to a
+        file-like object, followed by end.
+
+        The resources go in the page's head, but they are only known once
+        the body has been generated, so the body is first written to a
+        temporary file, which stays in memory unless it is large.
+        """
+        blk = self.block()
+        blk.lazy = lazy
+        if bundle:
+            blk.bundle = ScriptBundle()
+        from tempfile import SpooledTemporaryFile
+
+        spooled = SpooledTemporaryFile(
+            max_size=_spool_size, mode="w+", encoding="utf8", newline=""
+        )
+        with resource.scope(), spooled as body:
+            spool = ChunkWriter(body, flush_every)
+            write_text(blk.node_embed(node), spool.write)
+            spool.flush()
+
+            proc_extra = blk.process_extra()
+            proc_resources = blk.process_resources(
+                set(), _asset_directory(assets)
+            )
+
+            marker = f"<!--{resource.embed_key}-->"
+            page = self._page(proc_resources, Text(marker), proc_extra)
+            before, after = self.to_string(page).split(marker, 1)
+
+            writer = ChunkWriter(fp, flush_every)
+            writer.write(before)
+            body.seek(0)
+            while chunk := body.read(flush_every):
+                writer.write(chunk)
+            writer.write(after)
+            writer.write(end)
+            writer.flush()
+
+    def _page(self, resources, body, extra):
+        utf8 = H.meta(
+            {"http-equiv": "Content-type"}, content="text/html", charset="UTF-8"
         )
-        return self.to_string(elem)
+        return H.inline(
+            H.raw("<!DOCTYPE html>"),
+            H.html(
+                H.head(utf8, resources),
+                H.body(body, extra),
+            ),
+        )
+
+    def to_jupyter(self, node):  # pragma: no cover
+        with resource.scope():
+            blk = self.blockgen(node, seen_resources=set())
+            elem = H.div(
+                _asset_tag(*_assets["css_nbreset"]),
+                blk.processed_resources,
+                H.div["hrepr"](blk.result, blk.processed_extra),
+            )
+            return self.to_string(elem)
 
-    def as_page(self, node):
+    def as_page(self, node, assets=None, bundle=False, lazy=None):
         """
-        Wrap this Tag as a self-contained webpage. Create a page with
-        the following structure:
+        Wrap this Tag as a webpage. Create a page with the following
+        structure:
 
         .. code-block:: html
 
@@ -499,23 +1087,53 @@ class HTMLGenerator:
                 {self}
               </body>
             </html>
+
+        The page is self-contained, unless assets is given. In that case,
+        it is an AssetDirectory or the path to a directory where the
+        stylesheets and scripts in the resources are written, and the page
+        refers to them.
+
+        If bundle is True, the scripts that create the J objects in the
+        page are bundled in a single module, instead of two scripts for
+        each J object. Each module is then imported once, so if one of them
+        fails to load, none of the J objects are created.
+
+        lazy may be "visible" or "idle" to create J objects when their
+        element becomes visible or when the browser is idle, rather than on
+        load. J objects can also be made lazy individually with J(lazy=...).
         """
-        blk = self.blockgen(node, seen_resources=set())
-        utf8 = H.meta(
-            {"http-equiv": "Content-type"}, content="text/html", charset="UTF-8"
-        )
-        page = H.inline(
-            H.raw("<!DOCTYPE html>"),
-            H.html(
-                H.head(utf8, blk.processed_resources),
-                H.body(blk.result, blk.processed_extra),
-            ),
-        )
-        return self.to_string(page)
+        with resource.scope():
+            blk = self.blockgen(
+                node,
+                seen_resources=set(),
+                assets=_asset_directory(assets),
+                bundle=bundle,
+                lazy=lazy,
+            )
+            page = self._page(
+                blk.processed_resources, blk.result, blk.processed_extra
+            )
+            return self.to_string(page)
 
-    def __call__(self, node):
-        blk = self.blockgen(node)
-        return self.to_string(H.inline(blk.result, blk.processed_extra))
+    def __call__(self, node, session=None):
+        """Generate HTML for node, with the resources not yet delivered.
+
+        session is a ResourceSession or the key of a session in
+        self.sessions, for example a client id. It holds the resources
+        that were already delivered, which are not included again.
+        """
+        if session is not None:
+            from .session import ResourceSession
+
+            if not isinstance(session, ResourceSession):
+                session = self.sessions.get(session)
+        with resource.scope():
+            blk = self.blockgen(node, seen_resources=session)
+            return self.to_string(
+                H.inline(
+                    blk.processed_resources, blk.result, blk.processed_extra
+                )
+            )
 
 
 standard_html = HTMLGenerator()
@@ -6,6 +6,44 @@ $$HREPR = {
         node.innerHTML = html;
         return node.childNodes[0];
     },
+    patch(root, ops) {
+        const parse = html => {
+            const template = document.createElement("template");
+            template.innerHTML = html;
+            return template.content.childNodes;
+        }
+        for (let op of ops) {
+            let node = op.id ? document.getElementById(op.id) : root;
+            for (let i of op.path) {
+                node = node.children[i];
+            }
+            if (op.op === "replace") {
+                const nodes = [...parse(op.html)];
+                node.replaceWith(...nodes);
+                if (node === root) {
+                    root = nodes[0];
+                }
+            }
+            else if (op.op === "insert") {
+                const before = node.children[op.index] || null;
+                for (let child of [...parse(op.html)]) {
+                    node.insertBefore(child, before);
+                }
+            }
+            else if (op.op === "remove") {
+                node.remove();
+            }
+            else if (op.op === "attr") {
+                if (op.value === null) {
+                    node.removeAttribute(op.name);
+                }
+                else {
+                    node.setAttribute(op.name, op.value);
+                }
+            }
+        }
+        return root;
+    },
     prepare(node_id) {
         const self = document.getElementById(node_id);
         let resolve = null;
@@ -13,6 +51,11 @@ $$HREPR = {
         self.__object.__resolve = resolve;
         return self;
     },
+    prepareAll(node_ids) {
+        for (let node_id of node_ids) {
+            this.prepare(node_id);
+        }
+    },
     swap(orig, repl) {
         if (repl?.getElement) {
             repl = repl.getElement();
@@ -98,6 +141,52 @@ $$HREPR = {
             }
         }
     },
+    lazy(when, sel, cb) {
+        const node = document.querySelector(sel);
+        if (when === "idle") {
+            (window.requestIdleCallback || setTimeout)(cb);
+        }
+        else if (node && window.IntersectionObserver) {
+            this.lazyCallbacks ||= new Map();
+            this.observer ||= new IntersectionObserver(entries => {
+                for (let entry of entries) {
+                    if (entry.isIntersecting) {
+                        const cb = this.lazyCallbacks.get(entry.target);
+                        this.observer.unobserve(entry.target);
+                        this.lazyCallbacks.delete(entry.target);
+                        try {
+                            cb();
+                        }
+                        catch (error) {
+                            setTimeout(() => { throw error; });
+                        }
+                    }
+                }
+            }, {rootMargin: "200px"});
+            this.lazyCallbacks.set(node, cb);
+            this.observer.observe(node);
+        }
+        else {
+            cb();
+        }
+    },
+    runAll(table) {
+        for (let [scripts, sel, cb, when] of table) {
+            try {
+                if (when) {
+                    this.lazy(when, sel, () => this.run(scripts, sel, cb));
+                }
+                else {
+                    this.run(scripts, sel, cb);
+                }
+            }
+            catch (error) {
+                // Report the error without preventing the other entries
+                // from running, as if they were in separate scripts
+                setTimeout(() => { throw error; });
+            }
+        }
+    },
     ucall(obj, sym, ...arglist) {
         if (sym) {
             return $$HREPR.isFunc(obj[sym]) ? obj[sym](...arglist) : new obj[sym](...arglist);
@@ -69,6 +69,9 @@ class JData:
     src: str = None
     code: str = None
     stylesheet: str = None
+    # When to create the object: "visible", "idle", False (on load) or None
+    # (as set for the page)
+    lazy: str = None
 
 
 class J:
@@ -82,6 +85,7 @@ class J:
         selector=None,
         object=None,
         stylesheet=None,
+        lazy=None,
         _data=None,
         _path=None,
     ):
@@ -108,12 +112,18 @@ class J:
             )
             _path.append(Await())
 
+        if lazy not in ("visible", "idle", False, None):
+            raise ValueError(
+                f"lazy must be 'visible', 'idle' or False, not {lazy!r}"
+            )
+
         if _data is None:
             _data = JData(
                 namespace=namespace,
                 src=src,
                 code=code,
                 stylesheet=stylesheet,
+                lazy=lazy,
             )
 
         self._data = _data
@@ -121,7 +131,7 @@ class J:
         self._model_attributes = None
         self._returns = None
         self._async = None
-        self._serial = next(h.current_id)
+        self._serial = h.next_id()
 
     def _get_id(self):
         ret = self._get_returns()
@@ -191,8 +201,8 @@ class J:
 
         return H.construct(*args, **kwargs, constructor=self)
 
-    def as_page(self):
-        return self.as_node().as_page()
+    def as_page(self, assets=None, bundle=False, lazy=None):
+        return self.as_node().as_page(assets=assets, bundle=bundle, lazy=lazy)
 
     def __getattr__(self, attr):
         if attr.startswith("__") and attr.endswith("__"):  # pragma: no cover
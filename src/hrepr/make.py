@@ -1,7 +1,36 @@
-from .h import H
+from .h import H, bounded_setdefault
 
 ABSENT = object()
 
+# Shared Tags for constant or frequently repeated subtrees
+_interned = {}
+_intern_size = 1024
+
+# Atoms with longer contents are not interned
+_intern_max_length = 64
+
+
+def intern(key, make):
+    """Return a Tag for the subtree interned under key.
+
+    The subtree is created with make() the first time, and shared between
+    representations afterwards. Each call returns a new Tag that extends
+    the shared one without changes, so that modifying it, for example by
+    giving it an id with ensure_id, does not affect the other places where
+    the subtree is used.
+    """
+    try:
+        return _interned[key].fill()
+    except KeyError:
+        pass
+    except TypeError:
+        return make()
+    return bounded_setdefault(_interned, _intern_size, key, make()).fill()
+
+
+def _type_name(t):
+    return t if t is None or isinstance(t, str) else t.__name__
+
 
 class StandardMaker:
     def __init__(self, hrepr):
@@ -9,10 +38,9 @@ class StandardMaker:
         self.H = self.hrepr.H
 
     def tag_type(self, node, t):
+        t = _type_name(t)
         if t is None:
             return node
-        if not isinstance(t, str):
-            t = t.__name__
         return node[f"hreprt-{t}"]
 
     def ref(self, num, loop=False, content=None):
@@ -24,18 +52,33 @@ class StandardMaker:
             return ref
 
     def defn(self, key, name, type=None):
-        node = H.span[f"hreprk-{key}"](
-            H.span["hrepr-defn-key"](key),
-            " ",
-            H.span["hrepr-defn-name"](name),
-        )
-        return self.tag_type(node, type)
+        def make():
+            node = H.span[f"hreprk-{key}"](
+                H.span["hrepr-defn-key"](key),
+                " ",
+                H.span["hrepr-defn-name"](name),
+            )
+            return self.tag_type(node, type)
+
+        return intern(("defn", key, name, _type_name(type)), make)
 
     def atom(self, *content, type=None, value=ABSENT):
-        rval = self.tag_type(H.span(*content), type)
-        if value is not ABSENT:
-            rval = rval[f"hreprv-{value}"]
-        return rval
+        def make():
+            rval = self.tag_type(H.span(*content), type)
+            if value is not ABSENT:
+                rval = rval[f"hreprv-{value}"]
+            return rval
+
+        if all(
+            isinstance(c, str) and len(c) <= _intern_max_length for c in content
+        ):
+            key = ("atom", content, _type_name(type), value.__class__, value)
+            return intern(key, make)
+        else:
+            return make()
+
+    def delimiter(self, text):
+        return intern(("delimiter", text), lambda: H.span["hrepr-delim"](text))
 
     def sequence(
         self,
@@ -52,7 +95,10 @@ class StandardMaker:
             else:
                 return transform(x)
 
-        ellipsis = ellipsis or self.H.span("...")["hrepr-ellipsis"]
+        ellipsis = ellipsis or intern(
+            ("ellipsis", self.H),
+            lambda: self.H.span("...")["hrepr-ellipsis"],
+        )
 
         cap = (
             self.hrepr.config.sequence_max
@@ -81,21 +127,21 @@ class StandardMaker:
         return H.div["hreprl-s", "hrepr-body"](H.div(x))
 
     def table(self, rows, **kwargs):
-        t = H.table["hrepr-body"]()
+        trs = []
         width = 3
         for row in self.sequence(rows, rows=True, **kwargs):
             if isinstance(row, (list, tuple)):
                 width = len(row)
-                t = t(H.tr([H.td(x) for x in row]))
+                trs.append(H.tr([H.td(x) for x in row]))
             else:
-                t = t(H.tr(H.td(row, colspan=width)))
-        return t
+                trs.append(H.tr(H.td(row, colspan=width)))
+        return H.table["hrepr-body"](trs)
 
     def bracketed(self, body, start, end, type=None):
         node = H.div(
-            H.div["hrepr-open"](start),
+            intern(("open", start), lambda: H.div["hrepr-open"](start)),
             body,
-            H.div["hrepr-close"](end),
+            intern(("close", end), lambda: H.div["hrepr-close"](end)),
         )
         return self.tag_type(node, type)["hrepr-bracketed"]
 
@@ -109,7 +155,7 @@ class StandardMaker:
 
     def instance(self, title, fields, delimiter=None, type=None):
         if isinstance(delimiter, str):
-            delimiter = H.span["hrepr-delim"](delimiter)
+            delimiter = self.delimiter(delimiter)
         body = self.table(
             [[self.atom(k, type="symbol"), delimiter, v] for k, v in fields]
         )
@@ -1,34 +1,96 @@
+import os
+from contextvars import ContextVar
+from functools import lru_cache
 from itertools import count
-from uuid import uuid4
 
-embed_key = uuid4().hex
+here = os.path.dirname(os.path.abspath(__file__))
+
+embed_key = os.urandom(16).hex()
+
+
+@lru_cache(maxsize=None)
+def read_asset(*path):
+    """Read a file distributed with hrepr, on first use only."""
+    with open(os.path.join(here, *path), encoding="utf8") as f:
+        return f.read()
 
 
 class Registry:
-    def __init__(self):
+    """Map from ids to the Resources they were given.
+
+    A Registry with a parent is a scope created by scope(). Ids are
+    allocated by the root registry, so they are unique across all scopes.
+    """
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.root = self if parent is None else parent.root
         self.reset()
 
     def register(self, resource):
-        currid = next(self.id)
+        # next() on itertools.count and dict assignment are atomic, so
+        # this needs no lock
+        currid = next(self.root.id)
         self.id_to_resource[currid] = resource
         return currid
 
     def resolve(self, id):
-        return self.id_to_resource[id]
+        reg = self
+        while reg is not None:
+            res = reg.id_to_resource.get(id, None)
+            if res is not None:
+                return res
+            reg = reg.parent
+        raise KeyError(id)
 
     def reset(self):
-        self.id = count()
+        if self.root is self:
+            self.id = count()
         self.id_to_resource = {}
 
 
 registry = Registry()
 
+_current_registry = ContextVar("hrepr_resource_registry", default=None)
+
+
+def current_registry():
+    """Return the registry of the innermost scope, or the global registry."""
+    return _current_registry.get() or registry
+
+
+class _Scope:
+    __slots__ = ("registry", "token")
+
+    def __enter__(self):
+        self.registry = Registry(parent=current_registry())
+        self.token = _current_registry.set(self.registry)
+        return self.registry
+
+    def __exit__(self, typ, exc, tb):
+        _current_registry.reset(self.token)
+
+
+def scope():
+    """Register the Resources created in this block in a new registry.
+
+    The Resources can be embedded in any HTML generated in the block.
+    Once the block ends, the registry and the objects it refers to can be
+    garbage collected, whereas the global registry keeps them forever.
+    Scopes are local to the current thread or asyncio task.
+
+    HTMLGenerator renders each node in a scope, so the Resources that are
+    created while rendering, for example by ``__hrepr__`` methods, do not
+    accumulate.
+    """
+    return _Scope()
+
 
 class Resource:
     def __init__(self, obj, variant=""):
         self.obj = obj
         self.variant = variant
-        self.id = registry.register(self)
+        self.id = current_registry().register(self)
 
     def __str__(self):
         return f"[{embed_key}:{self.variant}{self.id}]"
@@ -0,0 +1,333 @@
+"""Compact binary serialization of Tag trees.
+
+Format (version 1):
+
+* The magic bytes ``HRT`` followed by the version number (one byte).
+* A string table: the number of strings, then for each string its length
+  in bytes and its UTF-8 encoding.
+* The root value.
+
+A value is an opcode followed by its payload. Integers are stored as
+(zigzag) LEB128 varints and strings as indexes in the string table. A Tag
+is stored as its class, name, number of attributes, children and
+resources, followed by the attribute keys and values, the children and the
+resources. A Tag that occurs several times is only stored once and then
+referred to by its index. Other objects are pickled.
+"""
+
+import hashlib
+import os
+import pickle
+import struct
+import tempfile
+from importlib import import_module
+
+from .h import Tag
+
+MAGIC = b"HRT"
+VERSION = 1
+
+NONE = 0
+TRUE = 1
+FALSE = 2
+INT = 3
+FLOAT = 4
+STR = 5
+TUPLE = 6
+LIST = 7
+DICT = 8
+TAG = 9
+TAGREF = 10
+PICKLE = 11
+
+# Tag classes
+SPECIALIZED = 0
+CLASS = 1
+
+_double = struct.Struct("<d")
+
+
+def _write_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _tag_class_info(tag):
+    cls = type(tag)
+    if Tag.specialized_tags.get(tag.name, None) is cls:
+        return None
+    else:
+        return (cls.__module__, cls.__qualname__)
+
+
+def dumps(value):
+    """Serialize a Tag (or any value that may be found in a Tag) to bytes."""
+    out = bytearray()
+    strings = {}
+    tags = {}
+
+    def write_str(s):
+        idx = strings.get(s, None)
+        if idx is None:
+            idx = strings[s] = len(strings)
+        _write_varint(out, idx)
+
+    to_write = [value]
+    while to_write:
+        x = to_write.pop()
+        typ = type(x)
+        if x is None:
+            out.append(NONE)
+        elif x is True:
+            out.append(TRUE)
+        elif x is False:
+            out.append(FALSE)
+        elif typ is int:
+            out.append(INT)
+            _write_varint(out, (x << 1) if x >= 0 else ((-x << 1) - 1))
+        elif typ is float:
+            out.append(FLOAT)
+            out += _double.pack(x)
+        elif typ is str:
+            out.append(STR)
+            write_str(x)
+        elif typ is tuple or typ is list:
+            out.append(TUPLE if typ is tuple else LIST)
+            _write_varint(out, len(x))
+            to_write.extend(reversed(x))
+        elif typ is dict:
+            out.append(DICT)
+            _write_varint(out, len(x))
+            to_write.extend(reversed([y for item in x.items() for y in item]))
+        elif isinstance(x, Tag):
+            idx = tags.get(id(x), None)
+            if idx is not None:
+                out.append(TAGREF)
+                _write_varint(out, idx)
+                continue
+            tags[id(x)] = len(tags)
+            out.append(TAG)
+            cls_info = _tag_class_info(x)
+            if cls_info is None:
+                out.append(SPECIALIZED)
+            else:
+                out.append(CLASS)
+                write_str(cls_info[0])
+                write_str(cls_info[1])
+            write_str(x.name)
+            attrs = [y for item in x.attributes.items() for y in item]
+            _write_varint(out, len(x.attributes))
+            _write_varint(out, len(x.children))
+            _write_varint(out, len(x.resources))
+            to_write.extend(reversed([*attrs, *x.children, *x.resources]))
+        else:
+            out.append(PICKLE)
+            data = pickle.dumps(x)
+            _write_varint(out, len(data))
+            out += data
+
+    header = bytearray(MAGIC)
+    header.append(VERSION)
+    _write_varint(header, len(strings))
+    for s in strings:
+        encoded = s.encode("utf8")
+        _write_varint(header, len(encoded))
+        header += encoded
+    return bytes(header + out)
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def byte(self):
+        if self.pos >= len(self.data):
+            raise ValueError("Truncated data")
+        b = self.data[self.pos]
+        self.pos += 1
+        return b
+
+    def varint(self):
+        result = 0
+        shift = 0
+        while True:
+            b = self.byte()
+            result |= (b & 0x7F) << shift
+            if b < 0x80:
+                return result
+            shift += 7
+
+    def bytes(self, n):
+        start = self.pos
+        self.pos += n
+        if self.pos > len(self.data):
+            raise ValueError("Truncated data")
+        return self.data[start : self.pos]
+
+
+def _build(kind, items, extra):
+    if kind == TUPLE:
+        return tuple(items)
+    elif kind == LIST:
+        return items
+    elif kind == DICT:
+        return dict(zip(items[::2], items[1::2]))
+    else:
+        cls, name, nattrs, nchildren, _ = extra
+        attrs = items[: 2 * nattrs]
+        return cls(
+            name=name,
+            attributes=dict(zip(attrs[::2], attrs[1::2])),
+            children=tuple(items[2 * nattrs : 2 * nattrs + nchildren]),
+            resources=tuple(items[2 * nattrs + nchildren :]),
+        )
+
+
+def loads(data):
+    """Deserialize bytes produced by dumps."""
+    if data[: len(MAGIC)] != MAGIC:
+        raise ValueError("Not a serialized hrepr Tag")
+    reader = _Reader(data)
+    reader.pos = len(MAGIC)
+    version = reader.byte()
+    if version != VERSION:
+        raise ValueError(f"Unsupported serialization version: {version}")
+
+    strings = [
+        reader.bytes(reader.varint()).decode("utf8")
+        for _ in range(reader.varint())
+    ]
+    tags = []
+
+    # Each frame is [kind, number of values, values, extra]
+    root = [None, 1, [], None]
+    stack = [root]
+    while True:
+        frame = stack[-1]
+        if len(frame[2]) == frame[1]:
+            if frame is root:
+                break
+            stack.pop()
+            kind, _, items, extra = frame
+            value = _build(kind, items, extra)
+            if kind == TAG:
+                tags[extra[-1]] = value
+            stack[-1][2].append(value)
+            continue
+
+        op = reader.byte()
+        if op == NONE:
+            frame[2].append(None)
+        elif op == TRUE:
+            frame[2].append(True)
+        elif op == FALSE:
+            frame[2].append(False)
+        elif op == INT:
+            n = reader.varint()
+            frame[2].append((n >> 1) if not (n & 1) else -((n + 1) >> 1))
+        elif op == FLOAT:
+            frame[2].append(_double.unpack(reader.bytes(8))[0])
+        elif op == STR:
+            frame[2].append(strings[reader.varint()])
+        elif op in (TUPLE, LIST):
+            stack.append([op, reader.varint(), [], None])
+        elif op == DICT:
+            stack.append([op, 2 * reader.varint(), [], None])
+        elif op == TAG:
+            if reader.byte() == SPECIALIZED:
+                cls = None
+            else:
+                module = strings[reader.varint()]
+                cls = import_module(module)
+                for part in strings[reader.varint()].split("."):
+                    cls = getattr(cls, part)
+            name = strings[reader.varint()]
+            if cls is None:
+                cls = Tag.specialize(name)
+            nattrs = reader.varint()
+            nchildren = reader.varint()
+            nresources = reader.varint()
+            total = 2 * nattrs + nchildren + nresources
+            tags.append(None)
+            extra = (cls, name, nattrs, nchildren, len(tags) - 1)
+            stack.append([op, total, [], extra])
+        elif op == TAGREF:
+            frame[2].append(tags[reader.varint()])
+        elif op == PICKLE:
+            frame[2].append(pickle.loads(reader.bytes(reader.varint())))
+        else:
+            raise ValueError(f"Invalid opcode: {op}")
+
+    return root[2][0]
+
+
+# Errors raised by loads on data that is corrupt or was written by another
+# version of the program
+_decoding_errors = (
+    ValueError,
+    IndexError,
+    TypeError,
+    AttributeError,
+    ImportError,
+    EOFError,
+    pickle.UnpicklingError,
+)
+
+
+class TagCache:
+    """On-disk cache of Tags, keyed by a hash of the content they represent.
+
+    The cache files may contain pickled objects, which are unpickled when
+    they are read, so only use a directory that no one else can write to.
+
+    Arguments:
+        directory: The directory where to store the cache files. It is
+            created if it does not exist.
+    """
+
+    def __init__(self, directory):
+        self.directory = os.fspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, content):
+        """Return the path of the cache file for the given content."""
+        if isinstance(content, str):
+            content = content.encode("utf8")
+        digest = hashlib.sha256(content).hexdigest()
+        return os.path.join(self.directory, f"{digest}.hrt")
+
+    def get(self, content, default=None):
+        """Return the Tag cached for content.
+
+        Return default if there is no cache file or if it cannot be decoded.
+        """
+        try:
+            with open(self.path(content), "rb") as f:
+                data = f.read()
+        except OSError:
+            return default
+        try:
+            return loads(data)
+        except _decoding_errors:
+            return default
+
+    def put(self, content, tag):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(dumps(tag))
+            os.replace(tmp, self.path(content))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def fetch(self, content, render):
+        """Return the Tag cached for content, or cache and return render()."""
+        tag = self.get(content)
+        if tag is None:
+            tag = render()
+            self.put(content, tag)
+        return tag
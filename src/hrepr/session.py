@@ -0,0 +1,134 @@
+"""Tracking of the resources delivered to each client.
+
+When HTML fragments are sent one after the other to the same page (a
+notebook, a server pushing updates to a browser, etc.), the resources they
+need only have to be sent once. A ResourceSession remembers which resources
+were delivered to a client, by a hash of their contents, and a SessionStore
+holds the sessions of many clients, forgetting the ones that are idle.
+Both are bounded, so memory usage does not grow with the number of renders
+or clients: when a resource is forgotten, it is simply sent again.
+"""
+
+import hashlib
+import pickle
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from . import serial
+from .h import Tag
+
+
+def resource_digest(resource):
+    """Return a hash of the contents of a resource."""
+    if isinstance(resource, Tag):
+        cache = resource._cache
+        if cache is not None and "digest" in cache:
+            return cache["digest"]
+    try:
+        digest = hashlib.sha256(serial.dumps(resource)).digest()
+    except (pickle.PicklingError, TypeError, AttributeError):
+        # Contains objects that cannot be pickled, like lambdas, which are
+        # only equal to themselves anyway
+        digest = hash(resource)
+    if isinstance(resource, Tag):
+        if resource._cache is None:
+            resource._cache = {}
+        resource._cache["digest"] = digest
+    return digest
+
+
+class ResourceSession:
+    """Set of the resources delivered to one client.
+
+    Arguments:
+        max_resources: The maximal number of resources to remember. The
+            least recently used resources are forgotten first.
+    """
+
+    def __init__(self, max_resources=1024):
+        self.max_resources = max_resources
+        self.delivered = OrderedDict()
+        self.last_used = time.monotonic()
+        self.lock = Lock()
+
+    def __contains__(self, resource):
+        digest = resource_digest(resource)
+        with self.lock:
+            if digest in self.delivered:
+                self.delivered.move_to_end(digest)
+                return True
+            return False
+
+    def __len__(self):
+        return len(self.delivered)
+
+    def add(self, resource):
+        digest = resource_digest(resource)
+        with self.lock:
+            self.delivered[digest] = None
+            self.delivered.move_to_end(digest)
+            while len(self.delivered) > self.max_resources:
+                self.delivered.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.delivered.clear()
+
+
+class SessionStore:
+    """ResourceSessions indexed by a key, for example a client id.
+
+    Arguments:
+        max_sessions: The maximal number of sessions. The least recently
+            used sessions are dropped first.
+        max_idle: Sessions that were not used for this many seconds are
+            dropped.
+        max_resources: The maximal number of resources to remember for
+            each session.
+    """
+
+    def __init__(self, max_sessions=1024, max_idle=3600, max_resources=1024):
+        self.max_sessions = max_sessions
+        self.max_idle = max_idle
+        self.max_resources = max_resources
+        self.sessions = OrderedDict()
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __contains__(self, key):
+        return key in self.sessions
+
+    def get(self, key):
+        """Return the session for key, creating it if needed."""
+        now = time.monotonic()
+        with self.lock:
+            session = self.sessions.get(key, None)
+            if session is None:
+                session = self.sessions[key] = ResourceSession(
+                    max_resources=self.max_resources
+                )
+            else:
+                self.sessions.move_to_end(key)
+            session.last_used = now
+            self._evict(now)
+        return session
+
+    def discard(self, key):
+        """Drop the session for key, for example when a client disconnects."""
+        with self.lock:
+            self.sessions.pop(key, None)
+
+    def _evict(self, now):
+        # Sessions are ordered from least to most recently used
+        while self.sessions:
+            oldest = next(iter(self.sessions.values()))
+            if (
+                len(self.sessions) > self.max_sessions
+                or now - oldest.last_used > self.max_idle
+            ):
+                self.sessions.popitem(last=False)
+            else:
+                break
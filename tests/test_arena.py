@@ -0,0 +1,98 @@
+import gc
+import tracemalloc
+
+import pytest
+
+from hrepr import H, hrepr
+from hrepr.arena import Arena, ArenaNode
+
+from .common import one_test_per_assert
+
+shared = H.b("shared")
+
+
+@pytest.mark.parametrize(
+    "tag",
+    [
+        H.div(),
+        H.div["classy"]("hello", id="eyedee"),
+        H.div("a<b", 3, 4.5, None, H.br(), H.b("bold", H.i("italic"))),
+        H.div(H.inline("x", H.i("y")), H.raw("<hr>"), H.script("var x = 1;")),
+        H.div(H.style("b { color: red; }"), H.input(disabled=True)),
+        H.div(shared, H.span(shared), shared),
+        H.div("hello", resources=H.style("b { color: red; }")),
+        H.div(hrepr([1, 2, {"a": 3}])),
+        H.div({"style": {"color": "red"}}, H.b(data_x=False)),
+    ],
+)
+def test_same_output(tag):
+    node = Arena().add_tag(tag)
+    assert str(node) == str(tag)
+    assert node.as_page() == tag.as_page()
+    assert node.materialize() == tag
+
+
+def test_add():
+    arena = Arena()
+    items = [arena.add("li", i, class_="item") for i in range(3)]
+    ul = arena.add("ul", {"class": "list"}, items, id="numbers")
+    assert len(arena) == 4
+    assert str(ul) == str(
+        H.ul(
+            {"class": "list"},
+            [H.li(i, class_="item") for i in range(3)],
+            id="numbers",
+        )
+    )
+
+
+arena = Arena()
+b = arena.add("b", "bold")
+style = H.style("b { color: red; }")
+node = arena.add("div", b, H.i("it"), id="x", resources=style)
+
+
+@one_test_per_assert
+def test_read_api():
+    assert node.name == "div"
+    assert node.attributes == {"id": "x"}
+    assert node.children == (ArenaNode(arena, b.index), H.i("it"))
+    assert node.resources == (style,)
+    assert b.resources == ()
+    assert node.id == "x"
+    assert b.id is None
+    assert node.get_attribute("id", None) == "x"
+    assert repr(b) == "<b>bold</b>"
+    assert b == arena.add("div", b).children[0]
+    assert b != arena.add("b", "bold")
+    assert b != H.b("bold")
+    assert hash(b) == hash(ArenaNode(arena, b.index))
+
+
+def test_foreign_arena_node():
+    node = Arena().add("b", "other")
+    assert str(Arena().add("div", node)) == "<div><b>other</b></div>"
+
+
+def test_embed_in_tag():
+    node = Arena().add_tag(H.b("bold", resources=H.style("b {}")))
+    assert str(H.div(node)) == "<div><b>bold</b></div>"
+    assert "<style>b {}</style>" in H.div(node).as_page()
+
+
+def test_memory():
+    gc.collect()
+    tracemalloc.start()
+    try:
+        arena = Arena()
+        rows = [
+            arena.add("tr", arena.add("td", "cell"), arena.add("td", "x"))
+            for i in range(10_000)
+        ]
+        arena.add("table", rows)
+        del rows
+        gc.collect()
+        used, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert used / len(arena) < 80
@@ -0,0 +1,76 @@
+import io
+import os
+
+from hrepr import H, J, hrepr, standard_html
+from hrepr.assets import AssetDirectory
+from hrepr.hgen import constructor_lib
+
+css = "span { color: red; }"
+tag = H.div(
+    H.span(
+        "hello", resources=[H.style(css), H.link(rel="stylesheet", href="x")]
+    ),
+    J(module="xyz").thing(),
+)
+
+
+def test_as_page(tmp_path):
+    page = tag.as_page(assets=tmp_path)
+    files = sorted(os.listdir(tmp_path))
+    assert len(files) == 2
+    (css_file,) = [f for f in files if f.endswith(".css")]
+    (js_file,) = [f for f in files if f.endswith(".js")]
+    assert (tmp_path / css_file).read_text() == css
+    assert (tmp_path / js_file).read_text() == constructor_lib.children[0]
+    assert f'<link rel="stylesheet" href="{css_file}" />' in page
+    assert f'<script src="{js_file}"></script>' in page
+    assert '<link rel="stylesheet" href="x" />' in page
+    assert css not in page
+    assert "$$HREPR = {" not in page
+    # Per-page scripts are still inline
+    assert "import default__" in page
+
+
+def test_content_hash(tmp_path):
+    assets = AssetDirectory(tmp_path / "static", url="/static/")
+    url = assets.write("hello", "css")
+    assert url.startswith("/static/") and url.endswith(".css")
+    assert assets.write("hello", "css") == url
+    assert (
+        AssetDirectory(tmp_path / "static").write("hello", "css")
+        == (url[len("/static/") :])
+    )
+    assert assets.write("hello!", "css") != url
+    assert len(os.listdir(tmp_path / "static")) == 2
+
+
+def test_page_refers_to_url(tmp_path):
+    assets = AssetDirectory(tmp_path, url="https://cdn.example.com/")
+    page = hrepr.page([1, 2], assets=assets)
+    assert '<link rel="stylesheet" href="https://cdn.example.com/' in page
+    assert "<style>" not in page
+
+
+def test_write_page(tmp_path):
+    assets = AssetDirectory(tmp_path)
+    f = io.StringIO()
+    standard_html.write_page(tag, f, assets=assets)
+    expected = standard_html.as_page(tag, assets=assets)
+    assert f.getvalue().split("<body>")[0] == expected.split("<body>")[0]
+
+
+def test_externalize(tmp_path):
+    assets = AssetDirectory(tmp_path)
+    blk = standard_html.block()
+    module = assets.externalize(H.script("f();", type="module"), blk)
+    assert str(module).startswith('<script type="module" src="')
+    assert (tmp_path / module.get_attribute("src", None)).read_text() == "f();"
+    unchanged = [
+        H.style(css, media="print"),
+        H.script(src="x.js"),
+        H.script(H.b("x")),
+        H.div(css),
+        "text",
+    ]
+    for resource in unchanged:
+        assert assets.externalize(resource, blk) is resource
@@ -2,6 +2,7 @@ import pytest
 from ovld import extend_super
 
 from hrepr import H, StdHrepr
+from hrepr.core import _mix
 
 from .common import one_test_per_assert
 
@@ -97,3 +98,59 @@ def test_mixin():
     assert hrepr(1, mixins=MyIntRepr) == H.span["my-integer"](
         "The number ", "1"
     ).fill(resources=H.style(".my-integer { color: fuchsia; }"))
+
+
+def test_mixin_subclass_is_cached():
+    assert _mix(StdHrepr, MyIntRepr) is _mix(StdHrepr, [MyIntRepr])
+    assert _mix(StdHrepr, MyIntRepr) is not _mix(CustomHrepr, MyIntRepr)
+
+
+class Hidden(list):
+    pass
+
+
+class HiddenRepr:
+    @extend_super
+    def hrepr(self, x: Hidden):
+        return self.H.span("hidden")
+
+
+def test_prescan_hidden_children():
+    x = [1]
+    iface = StdHrepr.make_interface(fill_resources=False, mixins=HiddenRepr)
+    # The pre-scan finds x inside Hidden, which does not display it
+    result = iface([Hidden([x]), x], prescan=True)
+    assert "#1=" not in str(result)
+    assert result == iface([Hidden([x]), x])
+    result = iface([Hidden([x]), x, x], prescan=True)
+    assert result == iface([Hidden([x]), x, x])
+
+
+def test_cached_variants():
+    iface = StdHrepr.make_interface(fill_resources=False)
+    assert iface(Katana(), katana=1) == H.b(1)
+    assert iface(Katana(), katana=True) == H.b(True)
+    assert iface(Katana(), katana=[1]) == H.b([1])
+    assert iface(Katana(), katana=(1,)) == H.b((1,))
+    # Not hashable, so not cached
+    assert iface(Katana(), katana={1: 2}) == H.b({1: 2})
+    assert iface(1, mixins=MyIntRepr).children == ("The number ", "1")
+    assert iface(1, mixins=MyIntRepr).children == ("The number ", "1")
+    assert len(iface._variants) == 5
+
+    # Reconfiguring the interface invalidates the variants
+    iface.configure(mixins=MyIntRepr)
+    assert not iface._variants
+    assert iface(1, katana=1).children == ("The number ", "1")
+
+
+def test_cached_variants_bounded():
+    iface = StdHrepr.make_interface(fill_resources=False)
+    for i in range(1, 1000):
+        assert iface(Katana(), katana=i) == H.b(i)
+    assert len(iface._variants) <= 128
+
+
+def test_cached_runners():
+    obj = [KatanaWrapper(Katana(), 9000) for _ in range(10)]
+    assert hrepr(obj) == hrepr(obj, norefs=True)
@@ -0,0 +1,222 @@
+from html.parser import HTMLParser
+
+import pytest
+
+from hrepr import H, hrepr
+from hrepr.arena import Arena
+from hrepr.diff import diff
+
+
+class Element:
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = {k: v or "" for k, v in attributes}
+        self.nodes = []
+        self.parent = None
+
+    @property
+    def children(self):
+        return [n for n in self.nodes if isinstance(n, Element)]
+
+    def replace(self, nodes):
+        i = self.parent.nodes.index(self)
+        self.parent.nodes[i : i + 1] = nodes
+        for node in nodes:
+            if isinstance(node, Element):
+                node.parent = self.parent
+
+    def __str__(self):
+        attrs = "".join(
+            f' {k}="{v}"' for k, v in sorted(self.attributes.items())
+        )
+        return (
+            f"<{self.name}{attrs}>{''.join(map(str, self.nodes))}</{self.name}>"
+        )
+
+
+class Parser(HTMLParser):
+    # Parse HTML into a minimal DOM, to check patches in the same way
+    # $$HREPR.patch applies them
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.root = Element("root", {})
+        self.stack = [self.root]
+
+    def add(self, node):
+        if isinstance(node, Element):
+            node.parent = self.stack[-1]
+        nodes = self.stack[-1].nodes
+        if isinstance(node, str) and nodes and isinstance(nodes[-1], str):
+            nodes[-1] += node
+        else:
+            nodes.append(node)
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "tr" and self.stack[-1].name == "table":
+            # Like browsers, wrap rows in an implicit tbody
+            tbody = Element("tbody", {})
+            self.add(tbody)
+            self.stack.append(tbody)
+        element = Element(tag, attrs)
+        self.add(element)
+        self.stack.append(element)
+
+    def handle_startendtag(self, tag, attrs):
+        self.add(Element(tag, attrs))
+
+    def handle_endtag(self, tag):
+        while self.stack.pop().name != tag:
+            pass
+
+    def handle_data(self, data):
+        self.add(data)
+
+    def handle_entityref(self, name):
+        self.add(f"&{name};")
+
+    def handle_charref(self, name):  # pragma: no cover
+        self.add(f"&#{name};")
+
+
+def parse(html):
+    parser = Parser()
+    parser.feed(html)
+    return parser.root
+
+
+def find_id(node, id):
+    if node.attributes.get("id", None) == id:
+        return node
+    for child in node.children:
+        if (result := find_id(child, id)) is not None:
+            return result
+
+
+def apply(html, ops):
+    document = parse(html)
+    for op in ops:
+        node = find_id(document, op["id"]) if op["id"] else document.nodes[0]
+        for i in op["path"]:
+            node = node.children[i]
+        if op["op"] == "replace":
+            node.replace(parse(op["html"]).nodes)
+        elif op["op"] == "insert":
+            new_nodes = parse(op["html"]).nodes
+            children = node.children
+            pos = (
+                node.nodes.index(children[op["index"]])
+                if op["index"] < len(children)
+                else len(node.nodes)
+            )
+            node.nodes[pos:pos] = new_nodes
+            for child in new_nodes:
+                child.parent = node
+        elif op["op"] == "remove":
+            node.replace([])
+        elif op["value"] is None:
+            del node.attributes[op["name"]]
+        else:
+            node.attributes[op["name"]] = op["value"]
+    return "".join(map(str, document.nodes))
+
+
+def li(*xs):
+    return [H.li(x) for x in xs]
+
+
+shared = H.b("shared")
+
+
+@pytest.mark.parametrize(
+    "old,new,nops",
+    [
+        (H.div("a"), H.div("a"), 0),
+        (shared, shared, 0),
+        (H.div("a"), H.div("b"), 1),
+        (H.div("a"), H.span("a"), 1),
+        (H.div(id="x"), H.div(id="y", title="t"), 2),
+        (H.div(hidden=True), H.div(), 1),
+        (H.div(), H.div(hidden=True), 1),
+        (H.div({"class": ["a", "b"]}), H.div({"class": ["a", "b"]}), 0),
+        (H.ul(li(1, 2, 3)), H.ul(li(1, 5, 3)), 1),
+        (H.ul(li(1, 2, 3)), H.ul(li(1, 3)), 1),
+        (H.ul(li(1, 2, 3)), H.ul(li(1, 2, 3, 4, 5)), 2),
+        (H.ul(li(1, 2, 3)), H.ul(H.li(0), li(1, 2, 3)), 1),
+        (H.ul(li(1, 2, 3)), H.ul(li(1, 2), H.b(7), H.li(3)), 1),
+        (H.ul(li(1, 2, 3)), H.ul(H.b(7), H.b(8)), 2 + 1),
+        (H.div("a", H.b("b"), "c"), H.div("a", H.b("x"), "c"), 1),
+        (H.div("a", H.b("b"), "c"), H.div("a", H.b("b"), "d"), 1),
+        (H.div("a", H.b("b")), H.div("a", H.b("b"), H.b("c")), 1),
+        (H.div("a", H.b("b")), H.div(H.inline("a", H.b("b"))), 0),
+        (H.div("a", None, 1), H.div("a1"), 0),
+        (H.div("", H.b(1)), H.div(H.b(2)), 1),
+        (H.div(H.raw("<b>x</b>")), H.div(H.raw("<b>y</b>")), 1),
+        (H.div(H.raw("<b>x</b>")), H.div(H.raw("<b>x</b>")), 0),
+        (H.inline(H.b(1)), H.inline(H.b(2)), 1),
+        (
+            H.div(id="box")(H.div(H.ul(li(1, 2)))),
+            H.div(id="box")(H.div(H.ul(li(1, 3)))),
+            1,
+        ),
+        (
+            H.table(H.tr(H.td(1), H.td(2)), H.tr(H.td(3), H.td(4))),
+            H.table(H.tr(H.td(1), H.td(2)), H.tr(H.td(3), H.td(5))),
+            1,
+        ),
+        (
+            H.table(H.tr(H.td(1))),
+            H.table(H.tr(H.td(1)), H.tr(H.td(2))),
+            1,
+        ),
+        (H.table(), H.table(H.tr(H.td(1))), 1),
+        (
+            H.table(H.caption("c"), H.tr(H.td(1))),
+            H.table(H.caption("c"), H.tr(H.td(2))),
+            1,
+        ),
+        (
+            H.table(H.tbody(H.tr(H.td(1)))),
+            H.table(H.tbody(H.tr(H.td(2)))),
+            1,
+        ),
+        (hrepr({"a": 1, "b": 2}), hrepr({"a": 1, "b": 3}), 1),
+        (hrepr({"a": 1}), hrepr({"a": 1, "b": 3}), 1),
+        (hrepr([1, 2, {"a": 3}]), hrepr([1, 2, {"a": 4}]), 1),
+        (hrepr([1, 2, {"a": 3}]), hrepr([1, 2, {"a": 3}, 4]), 1),
+    ],
+)
+def test_diff(old, new, nops):
+    ops = diff(old, new)
+    assert len(ops) == nops
+    assert apply(str(old), ops) == apply(str(new), [])
+
+
+def test_diff_addressing_by_id():
+    old = H.div(H.section(H.ul(li(1, 2)), id="sec"))
+    new = H.div(H.section(H.ul(li(1, 3)), id="sec"))
+    (op,) = diff(old, new)
+    assert op["id"] == "sec"
+    assert op["path"] == [0, 1]
+
+
+def test_diff_table_rows():
+    old = H.div(H.table(H.tr(H.td(1), H.td(2)), H.tr(H.td(3), H.td(4))))
+    new = H.div(H.table(H.tr(H.td(1), H.td(2)), H.tr(H.td(3), H.td(5))))
+    (op,) = diff(old, new)
+    # Rows are in the implicit tbody, the first child of the table
+    assert op["path"] == [0, 0, 1, 1]
+    (op,) = diff(old, H.div(old.children[0](H.tr(H.td(6)))))
+    assert op["op"] == "insert"
+    assert op["path"] == [0, 0]
+
+
+def test_diff_arena():
+    arena = Arena()
+    old = arena.add("ul", [arena.add("li", i) for i in range(3)])
+    new = arena.add_tag(H.ul(li(0, 1, 7)))
+    ops = diff(old, new)
+    assert ops == [
+        {"op": "replace", "id": None, "path": [2], "html": "<li>7</li>"}
+    ]
+    assert diff(H.div(old), H.div(old)) == []
@@ -2,7 +2,7 @@ import json
 
 import pytest
 
-from hrepr import standard_html
+from hrepr import hgen, resource, standard_html
 from hrepr.h import H
 from hrepr.resource import JSExpression, JSFunction, Resource
 
@@ -83,3 +83,71 @@ def test_attr_embed_bad():
 
     with pytest.raises(ValueError):
         attr_embed(H.div())
+
+
+class Nested:
+    def __init__(self, *children):
+        self.children = list(children)
+
+    def __js_embed__(self, gen):
+        return "[" + ",".join(str(Resource(c)) for c in self.children) + "]"
+
+
+class Recursive:
+    def __js_embed__(self, gen):
+        return f"f({self.resource})"
+
+
+def expand(code):
+    blk = standard_html.block()
+    return blk.expand_resources(code, blk.js_embed)
+
+
+def test_expand_resources():
+    nested = Resource(Nested(1, Nested("a", Nested()), 3))
+    assert expand(f"x = {nested}; y = {nested};") == (
+        'x = [1,["a",[]],3]; y = [1,["a",[]],3];'
+    )
+    assert expand("no placeholders") == "no placeholders"
+
+
+def test_expand_resources_cached():
+    code = f"x = {Resource(1)} + {Resource(2)};"
+    assert expand(code) == "x = 1 + 2;"
+    assert hgen._placeholder_cache[(resource.embed_key, code)][::2] == (
+        "x = ",
+        " + ",
+        ";",
+    )
+    assert expand(code) == "x = 1 + 2;"
+
+
+def test_expand_resources_cycle():
+    recursive = Recursive()
+    recursive.resource = Resource(recursive)
+    with pytest.raises(ValueError, match="embedded in itself"):
+        expand(f"g({recursive.resource})")
+
+
+def test_expand_large_script():
+    resources = [Resource(i) for i in range(10_000)]
+    code = ";".join(f"x{i} = {r}" for i, r in enumerate(resources))
+    assert expand(code) == ";".join(f"x{i} = {i}" for i in range(10_000))
+
+
+def test_placeholder_cache_max_length(monkeypatch):
+    monkeypatch.setattr(hgen, "_placeholder_cache", {})
+    monkeypatch.setattr(hgen, "_placeholder_cache_max_length", 50)
+    short = f"{Resource(1)};"
+    long = f"{Resource(2)};" + " " * 50
+    assert expand(short) == "1;"
+    assert expand(long) == "2;" + " " * 50
+    assert list(hgen._placeholder_cache) == [(resource.embed_key, short)]
+
+
+def test_placeholder_cache_bounded(monkeypatch):
+    monkeypatch.setattr(hgen, "_placeholder_cache", {})
+    monkeypatch.setattr(hgen, "_placeholder_cache_size", 10)
+    for i in range(100):
+        assert expand(f"{Resource(i)};") == f"{i};"
+    assert len(hgen._placeholder_cache) == 10
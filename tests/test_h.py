@@ -2,7 +2,7 @@ from itertools import count
 
 import pytest
 
-from hrepr import H, Tag, h
+from hrepr import H, Lazy, Tag, h
 
 from .common import one_test_per_assert
 
@@ -144,6 +144,80 @@ def test_incremental():
     assert matches(d, '<div id="paramount" sheep="bah">crumpet<b>tea</b></div>')
 
 
+@one_test_per_assert
+def test_classes():
+    assert matches(H.div["a"]["b"](), '<div class="a b"></div>')
+    assert matches(H.div["a", "b"]("x")["c"], '<div class="a b c">x</div>')
+    assert matches(H.div({"class": "x"})["y"], '<div class="x y"></div>')
+    assert matches(
+        H.div({"class": ["x", "y"]})["z"], '<div class="x y z"></div>'
+    )
+    assert matches(H.div["a"]({"class": "z"}), '<div class="z"></div>')
+    assert matches(H.div["#nope"](), "<div></div>")
+
+
+def test_lazy_composition():
+    parent = H.div("a", [H.b("b")])
+    child = parent["klass"]("c")
+    assert not parent._constructed
+    assert matches(child, '<div class="klass">a<b>b</b>c</div>')
+    assert not parent._constructed
+    assert matches(parent, "<div>a<b>b</b></div>")
+
+
+def test_bounded_setdefault():
+    table = {}
+    for i in range(5):
+        assert h.bounded_setdefault(table, 3, i, str(i)) == str(i)
+    assert table == {2: "2", 3: "3", 4: "4"}
+    assert h.bounded_setdefault(table, 3, 4, "other") == "4"
+
+
+def test_generator_children():
+    tag = H.div(str(i) for i in range(3))
+    assert matches(tag, "<div>012</div>")
+    assert matches(tag, "<div>012</div>")
+    nested = H.div(["a", (str(i) for i in range(2))])
+    assert nested._children == ["a", "0", "1"]
+    assert matches(nested, "<div>a01</div>")
+
+
+def test_flatten_once(monkeypatch):
+    flattened = []
+    original = h.flatten
+
+    def flatten(children):
+        flattened.append(children)
+        return original(children)
+
+    monkeypatch.setattr(h, "flatten", flatten)
+    parent = H.div(["a", "b"])
+    assert matches(parent, "<div>ab</div>")
+    child = parent["x"](["c"])
+    assert matches(child, '<div class="x">abc</div>')
+    assert flattened.count((["a", "b"],)) == 1
+    assert flattened.count((["c"],)) == 1
+
+
+def test_builder():
+    builder = H.ul["list"].builder()
+    for i in range(3):
+        builder.append(H.li(i))
+    builder.extend([H.li(3), H.li(4)])
+    builder.add_class("numbers")
+    builder.set(data_count=5)
+    builder.add_resources(H.style("ul { color: red; }"))
+    tag = builder.build()
+    assert matches(
+        tag,
+        '<ul class="list numbers" data-count="5">'
+        + "".join(f"<li>{i}</li>" for i in range(5))
+        + "</ul>",
+    )
+    assert tag.resources == (H.style("ul { color: red; }"),)
+    assert isinstance(tag, type(H.ul))
+
+
 @one_test_per_assert
 def test_misc():
     assert matches(H.whimsy("cal"), "<whimsy>cal</whimsy>")
@@ -153,6 +227,202 @@ def test_misc():
     assert repr(H.div("soupe")) == str(H.div("soupe"))
 
 
+def test_lazy_children():
+    produced = []
+
+    def items():
+        for i in range(3):
+            produced.append(i)
+            yield H.li(i), [" ", (c for c in "ab")]
+
+    tag = H.ul["list"](Lazy(items()))
+    assert not produced
+    assert len(tag.children) == 1
+    assert matches(
+        tag,
+        '<ul class="list"><li>0</li> ab<li>1</li> ab<li>2</li> ab</ul>',
+    )
+    assert produced == [0, 1, 2]
+
+
+def test_lazy_children_reusable():
+    tag = H.div(Lazy([H.b(1), [H.i(2)]]), "end")
+    assert matches(tag, "<div><b>1</b><i>2</i>end</div>")
+    assert matches(tag, "<div><b>1</b><i>2</i>end</div>")
+    assert "<body><div><b>1</b><i>2</i>end</div></body>" in tag.as_page()
+
+
+tree = H.div["main"](
+    H.ul["list"](
+        H.li["item", "first"]("a", id="first"),
+        H.li["item"]("b"),
+        H.li({"class": "item last"}, H.b("c")),
+    ),
+    H.b("d"),
+    "text",
+)
+
+
+@one_test_per_assert
+def test_query():
+    assert [t.name for t in tree.walk()] == [
+        "div",
+        "ul",
+        "li",
+        "li",
+        "li",
+        "b",
+        "b",
+    ]
+    assert tree.find("ul") is tree.children[0]
+    assert tree.find("ul") is tree.children[0]
+    assert [str(t) for t in tree.find_all("b")] == ["<b>c</b>", "<b>d</b>"]
+    assert tree.find(id="first").children == ("a",)
+    assert len(tree.find_all(class_="item")) == 3
+    assert len(tree.find_all("li", class_=["item", "first"])) == 1
+    assert tree.find("li", class_="last").children == (H.b("c"),)
+    assert tree.find("li", id="nope") is None
+    assert tree.find_all("b", class_="item") == []
+    assert tree.find_all("li", predicate=lambda t: "b" in t.children) == [
+        tree.children[0].children[1]
+    ]
+    assert tree.find(predicate=lambda t: t.name == "b") == H.b("c")
+    assert tree.find_all() == list(tree.walk())
+    assert tree.select("li.item.first#first") == [tree.find(id="first")]
+    assert tree.select(".main") == [tree]
+    assert tree.select("b") == tree.find_all("b")
+    assert tree.select("li.last") == [tree.find("li", class_="last")]
+
+
+def test_query_index():
+    tag = H.div(H.span["x"](i) for i in range(10))
+    assert tag._cache is None
+    assert len(tag.find_all("span", class_="x")) == 10
+    index = tag._cache["index"]
+    assert tag.find("span") is tag.children[0]
+    assert tag._cache["index"] is index
+    # Predicate-only queries walk the tree
+    assert tag.find(predicate=lambda t: 3 in t.children) is tag.children[3]
+
+
+def test_walk_paths():
+    assert [(p, t.name) for p, t in tree.walk(paths=True)] == [
+        ((), "div"),
+        ((0,), "ul"),
+        ((0, 0), "li"),
+        ((0, 1), "li"),
+        ((0, 2), "li"),
+        ((0, 2, 0), "b"),
+        ((1,), "b"),
+    ]
+
+
+def test_persistent_updates():
+    ul = tree.children[0]
+
+    new = tree.replace((0, 1), H.li("B"))
+    assert str(new.children[0].children[1]) == "<li>B</li>"
+    assert new.children[0].children[0] is ul.children[0]
+    assert new.children[1] is tree.children[1]
+    assert str(tree.children[0].children[1]) == '<li class="item">b</li>'
+
+    new = tree.wrap((1,), H.section["box"])
+    assert str(new.children[1]) == '<section class="box"><b>d</b></section>'
+    assert new.children[0] is ul
+
+    new = tree.wrap([0, 2, 0], lambda b: H.i(*b.children))
+    assert (
+        str(new.children[0].children[2])
+        == '<li class="item last"><i>c</i></li>'
+    )
+
+    new = tree.remove((0, 0))
+    assert len(new.children[0].children) == 2
+    assert new.children[0].children[0] is ul.children[1]
+
+    new = tree.replace((), H.p("root"))
+    assert str(new) == "<p>root</p>"
+
+    new = tree.replace((2,), "other text")
+    assert new.children[2] == "other text"
+    assert new.attributes == tree.attributes
+
+
+def test_bulk_update():
+    new = tree.update(
+        {
+            (0, 0): lambda li: (),
+            (0, 1): lambda li: [li, H.li("inserted")],
+            (0,): lambda ul: ul["updated"],
+            (1,): lambda b: H.b("D"),
+        }
+    )
+    assert str(new) == str(
+        H.div["main"](
+            H.ul["list", "updated"](
+                H.li["item"]("b"),
+                H.li("inserted"),
+                H.li({"class": "item last"}, H.b("c")),
+            ),
+            H.b("D"),
+            "text",
+        )
+    )
+    assert new.children[0].children[2] is tree.children[0].children[2]
+    assert tree.update({}) is tree
+
+
+def test_negative_path_indexes():
+    assert tree.replace((-1,), "x") == tree.replace((2,), "x")
+    assert tree.remove((0, -1)) == tree.remove((0, 2))
+    assert tree.remove((-3,)).children == tree.children[1:]
+
+
+def test_bad_updates():
+    with pytest.raises(IndexError):
+        tree.replace((5,), "x")
+    with pytest.raises(IndexError):
+        tree.replace((-4,), "x")
+    with pytest.raises(IndexError):
+        tree.remove((0, -4))
+    with pytest.raises(ValueError, match="same node"):
+        tree.update({(-1,): lambda node: "x", (2,): lambda node: "y"})
+    with pytest.raises(TypeError, match="Cannot index into str"):
+        tree.replace((2, 0), "x")
+    with pytest.raises(ValueError, match="single Tag"):
+        tree.remove(())
+
+
+def test_hash_is_cached():
+    inner = H.b("hello")
+    outer = H.div(inner, id="x")
+    h = hash(outer)
+    assert outer._hash == h
+    assert inner._hash == hash(inner)
+    assert hash(outer) == h
+    assert hash(H.div(H.b("hello"), id="x")) == h
+
+
+def test_equality_shortcuts():
+    a = H.div(H.b("hello"))
+    b = H.div(H.b("hello"))
+    assert a == a
+    assert a == b
+    assert a != "<div><b>hello</b></div>"
+    hash(a)
+    b._hash = hash(a) + 1
+    # Differing hashes are enough to conclude the tags differ
+    assert a != b
+
+
+def test_hash_attribute_order():
+    x = H.div(a="1", b="2")
+    y = H.div(b="2", a="1")
+    assert x == y
+    assert hash(x) == hash(y)
+    assert x == y
+
+
 def test_dash():
     assert matches(H.some_tag("xyz"), "<some-tag>xyz</some-tag>")
 
@@ -1,3 +1,7 @@
+import gzip
+import io
+import re
+import sys
 from html import escape
 from types import FunctionType, MethodType
 from typing import Union
@@ -5,9 +9,16 @@ from typing import Union
 import pytest
 from ovld import extend_super
 
-from hrepr import H, hrepr
-from hrepr.hgen import BlockGenerator, HTMLGenerator
+from hrepr import H, J, Lazy, hgen, hrepr
+from hrepr.hgen import (
+    BlockGenerator,
+    HTMLGenerator,
+    escape,
+    standard_html,
+    write_text,
+)
 from hrepr.resource import JSExpression, Resource
+from hrepr.textgen import Breakable, Sequence, Text
 
 
 class CustomBlockGenerator(BlockGenerator):
@@ -74,6 +85,237 @@ def test_embed_object_hrepr():
     customgen = HTMLGenerator(
         block_generator_class=CustomBlockGenerator, hrepr=hrepr
     )
+    # The first call includes hrepr's stylesheet
+    assert customgen(X()).endswith("</style><b>H</b>")
     assert customgen(X()) == "<b>H</b>"
     o = object()
     assert customgen(o) == str(hrepr(o))
+
+
+def _cached_html(tag, gen):
+    return tag._cache[(gen.block().cache_key())][0]
+
+
+def test_cached_html():
+    style = H.style("b { color: red; }")
+    tag = H.div(H.b("hello"), resources=style)
+    assert tag._cache is None
+    assert str(tag) == "<div><b>hello</b></div>"
+    assert _cached_html(tag, standard_html) == "<div><b>hello</b></div>"
+
+    # The cached fragment is spliced in wherever the Tag appears
+    tag._cache[standard_html.block().cache_key()] = ("<i>cached</i>", (style,))
+    assert str(tag) == "<i>cached</i>"
+    assert str(H.div(tag, tag)) == "<div><i>cached</i><i>cached</i></div>"
+    # Along with its resources
+    assert "<style>b { color: red; }</style>" in H.div(tag).as_page()
+
+    # Other generators do not share the cache
+    customgen = HTMLGenerator(block_generator_class=CustomBlockGenerator)
+    assert customgen.to_string(tag) == "<div><b>hello</b></div>"
+
+
+def test_cached_resources():
+    style = H.style("b { color: red; }")
+    standard_html.as_page(H.div(resources=style))
+    assert (
+        _cached_html(style, standard_html) == "<style>b { color: red; }</style>"
+    )
+
+
+@pytest.mark.parametrize(
+    "tag",
+    [
+        H.div(Lazy(["a", "b"])),
+        H.div(X()),
+        H.div(H.b(object())),
+        H.div(H.script(type="module"), J(code="var x = 1;").x),
+        H.div(H.script(f"f({Resource([1])})")),
+        H.button(onclick=JSExpression(f"f({Resource([1])})")),
+        H.div("x" * (hgen._cached_html_max_length + 1)),
+    ],
+)
+def test_not_cached(tag):
+    str(tag)
+    assert tag._cache is None
+
+
+def test_resource_changes():
+    d = {"a": 1}
+    tag = H.script(f"f({Resource(d)})")
+    assert str(tag) == '<script>f({"a": 1})</script>'
+    d["a"] = 2
+    assert str(tag) == '<script>f({"a": 2})</script>'
+
+
+def test_attribute_changes():
+    style = {"color": "red"}
+    classes = ["a"]
+    tag = H.div({"class": classes}, style=style)
+    assert str(tag) == '<div class="a" style="color:red;"></div>'
+    style["color"] = "blue"
+    classes.append("b")
+    assert str(tag) == '<div class="a b" style="color:blue;"></div>'
+    assert tag._cache is None
+
+
+def test_not_cached_attr_embed():
+    class Dynamic:
+        def __attr_embed__(self, gen):
+            return "dynamic"
+
+    tag = H.div(title=Dynamic())
+    assert (
+        str(H.div(H.span(), tag))
+        == '<div><span></span><div title="dynamic"></div></div>'
+    )
+    assert str(tag) == '<div title="dynamic"></div>'
+    assert tag._cache is None
+
+
+def test_deep_tree():
+    tag = "x"
+    for _ in range(sys.getrecursionlimit() * 2):
+        tag = H.div(tag)
+    n = sys.getrecursionlimit() * 2
+    assert str(tag) == "<div>" * n + "x" + "</div>" * n
+
+
+def test_write_text():
+    parts = []
+    fmt = Breakable(
+        start="[",
+        body=[Sequence("a", Text("b"), None, 1), Breakable(None, ["c"], None)],
+        end="]",
+    )
+    write_text(fmt, parts.append)
+    assert parts == ["[", "a", "b", "None", "1", "c", "]"]
+    assert "".join(parts) == str(fmt)
+
+
+class ChunkRecorder(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def write(self, s):
+        self.chunks.append(s)
+        return super().write(s)
+
+
+class Items:
+    def __iter__(self):
+        return (H.li["item"](i) for i in range(1000))
+
+
+big_tag = H.div(
+    H.h1("Report", resources=H.style("h1 { color: red; }")),
+    H.ul(Lazy(Items())),
+    J(module="xyz").thing(),
+)
+
+
+def test_write():
+    expected = standard_html.to_string(big_tag)
+    f = ChunkRecorder()
+    standard_html.write(big_tag, f, flush_every=1000)
+    assert f.getvalue() == expected
+    assert len(f.chunks) > 10
+    assert all(len(chunk) < 1100 for chunk in f.chunks)
+
+
+def test_write_binary():
+    f = io.BytesIO()
+    standard_html.write(H.div("été"), f)
+    assert f.getvalue() == "<div>été</div>".encode("utf8")
+
+
+def test_write_gzip(tmp_path):
+    path = tmp_path / "report.html.gz"
+    with gzip.open(path, "wb") as f:
+        standard_html.write(big_tag, f, flush_every=100)
+    with gzip.open(path, "rt", encoding="utf8") as f:
+        assert f.read() == standard_html.to_string(big_tag)
+
+
+@pytest.mark.parametrize("spool_size", [1 << 22, 100])
+def test_write_page(spool_size, monkeypatch):
+    monkeypatch.setattr(hgen, "_spool_size", spool_size)
+    expected = standard_html.as_page(big_tag)
+    f = ChunkRecorder()
+    standard_html.write_page(big_tag, f, flush_every=1000)
+    # Script import names are numbered when the scripts are generated
+    assert re.sub(r"__\d+", "", f.getvalue()) == re.sub(r"__\d+", "", expected)
+    assert len(f.chunks) > 10
+
+
+def test_page_file(tmp_path):
+    path = tmp_path / "page.html"
+    hrepr.page([1, 2, 3], file=str(path))
+    f = io.StringIO()
+    hrepr.page([1, 2, 3], file=f)
+    expected = str(hrepr.page([1, 2, 3])) + "\n"
+    assert path.read_text(encoding="utf8") == expected
+    assert f.getvalue() == expected
+
+
+def test_page_binary_file(tmp_path):
+    expected = (str(hrepr.page([1, 2, 3])) + "\n").encode("utf8")
+    f = io.BytesIO()
+    hrepr.page([1, 2, 3], file=f)
+    assert f.getvalue() == expected
+    path = tmp_path / "page.html.gz"
+    with gzip.open(path, "wb") as f:
+        hrepr.page([1, 2, 3], file=f)
+    with gzip.open(path, "rb") as f:
+        assert f.read() == expected
+
+
+def test_attribute_cache():
+    blk = standard_html.block()
+    attrs = {"class": ("hrepr-bracketed", "hreprt-list"), "id": "x"}
+    result = blk.attribute_string(attrs)
+    assert result == ' class="hrepr-bracketed hreprt-list" id="x"'
+    assert blk.attribute_string(dict(attrs)) is result
+    assert blk.attribute_string({"a": True}) == " a"
+    assert blk.attribute_string({"a": 1}) == ' a="1"'
+    assert blk.attribute_string({"a": ["b", "<c>"]}) == ' a="b &lt;c&gt;"'
+    assert blk.attribute_string({"style": {"color": "red"}}) == (
+        ' style="color:red;"'
+    )
+    assert blk.attribute_string({"a": (1, 2)}) == ' a="1 2"'
+    assert blk.attribute_string({}) == ""
+
+
+def test_attribute_cache_per_generator(customgen):
+    attrs = {"onclick": "f"}
+    assert customgen.block().attribute_string(attrs) == ' onclick="f"'
+    assert standard_html.block().attribute_string(attrs) == ' onclick="f"'
+    assert (CustomBlockGenerator, (("onclick", str, "f"),)) in (
+        hgen._attribute_cache
+    )
+
+
+def test_attribute_cache_bounded(monkeypatch):
+    monkeypatch.setattr(hgen, "_attribute_cache", {})
+    monkeypatch.setattr(hgen, "_attribute_cache_size", 10)
+    blk = standard_html.block()
+    for i in range(100):
+        assert blk.attribute_string({"x": i}) == f' x="{i}"'
+    assert len(hgen._attribute_cache) == 10
+
+
+def test_escape():
+    s = "hello world"
+    assert escape(s) is s
+    assert escape("a < b & 'c'") == "a &lt; b &amp; &#x27;c&#x27;"
+    assert escape('"') == "&quot;"
+    assert escape(">") == "&gt;"
+
+
+def test_write_page_bundle():
+    expected = standard_html.as_page(big_tag, bundle=True)
+    f = io.StringIO()
+    standard_html.write_page(big_tag, f, bundle=True)
+    assert "$$HREPR.runAll(" in expected
+    assert re.sub(r"__\d+", "", f.getvalue()) == re.sub(r"__\d+", "", expected)
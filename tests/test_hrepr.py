@@ -1,12 +1,14 @@
 import dataclasses
+import gc
 import re
 import sys
+import weakref
 from dataclasses import dataclass
 from enum import Enum
 
 import pytest
 
-from hrepr import H
+from hrepr import H, make
 from hrepr import hrepr as real_hrepr
 from hrepr.core import styledir
 from hrepr.j import J
@@ -302,3 +304,141 @@ def test_postprocess():
     assert hrepr(1, postprocess=lambda x, obj, hrepr: x["newclass"]) == H.span[
         "hreprt-int", "newclass"
     ]("1")
+
+
+class Temporaries:
+    def __hrepr__(self, H, hrepr):
+        # Each list is freed after being rendered, so its id may be reused
+        return H.div(*[hrepr([i]) for i in range(10)])
+
+
+def test_no_reference_to_temporaries():
+    assert "hrepr-ref" not in str(hrepr(Temporaries()))
+
+
+def test_no_reference_to_atoms():
+    s = "hello this is a bit long"
+    assert "hrepr-ref" not in str(hrepr([s, s, Opaque, Opaque]))
+
+
+def test_state_released_after_render():
+    pt = Point(1, 2)
+    ref = weakref.ref(pt)
+    gc.disable()
+    try:
+        hrepr([pt, pt])
+        del pt
+        assert ref() is None
+    finally:
+        gc.enable()
+
+
+class Twice:
+    def __init__(self, x):
+        self.x = x
+
+    def __hrepr__(self, H, hrepr):
+        return H.div(hrepr(self.x), hrepr(self.x))
+
+
+_shared = [1, 2]
+
+
+@pytest.mark.parametrize(
+    "obj,config",
+    [
+        ([[1, 2]] * 2, {}),
+        ([[1, 2]] * 2, {"shortrefs": True}),
+        ([Opaque(), _shared, _shared], {}),
+        (_recursive(), {}),
+        ([_recursive()] * 2, {}),
+        ({"a": _shared, "b": _shared, "c": [3]}, {}),
+        (Point(_shared, _shared), {}),
+        (TypeError("oh no!", _shared, _shared), {}),
+        (Twice(_shared), {}),
+        ([_shared, Twice(_shared)], {}),
+        ([_shared, 0, 0, 0, 0, _shared, 0, 0], {"sequence_max": 4}),
+        ([_shared, 0, 0, 0, 0, 0, _shared], {"sequence_max": 4}),
+        ({_shared[0]: _shared, 2: 0, 3: 0, 4: 0, 5: 0}, {"sequence_max": 3}),
+        ([[_shared], _shared], {"max_depth": 2}),
+        ([[_shared], _shared], {"max_depth": 3}),
+        ([[_shared], _shared], {"norefs": True}),
+    ],
+)
+def test_prescan(obj, config):
+    assert hrepr(obj, prescan=True, **config) == hrepr(obj, **config)
+
+
+def test_prescan_multiarg():
+    assert hrepr(_shared, _shared, prescan=True) == hrepr(_shared, _shared)
+
+
+def test_prescan_numbering():
+    # With the pre-scan, references are numbered in the order the objects
+    # are first displayed
+    a = [1]
+    b = [2]
+    result = str(hrepr([a, b, b, a], prescan=True, shortrefs=True))
+    refs = re.findall(pattern=r'hrepr-ref">#(\d)', string=result)
+    assert refs == ["1", "2", "2", "1"]
+
+
+def test_interned_subtrees():
+    mk = make.StandardMaker(real_hrepr.hclass())
+    assert mk.delimiter(": ")._parent is mk.delimiter(": ")._parent
+    assert mk.delimiter(": ") is not mk.delimiter(": ")
+    assert mk.delimiter(": ") == H.span["hrepr-delim"](": ")
+    b1 = mk.bracketed(H.b("x"), "[", "]")
+    b2 = mk.bracketed(H.b("y"), "[", "]")
+    assert b1.children[0]._parent is b2.children[0]._parent
+    assert b1.children[2]._parent is b2.children[2]._parent
+    assert mk.sequence([1, 2, 3, 4], sequence_max=3, transform=str)[
+        1
+    ]._parent is (
+        mk.sequence([5, 6, 7, 8], sequence_max=3, transform=str)[1]._parent
+    )
+
+
+def is_interned(tag):
+    return any(tag._parent is t for t in make._interned.values())
+
+
+def test_interned_atoms():
+    mk = make.StandardMaker(real_hrepr.hclass())
+    assert (
+        mk.atom("None", value=None)._parent
+        is mk.atom("None", value=None)._parent
+    )
+    assert mk.atom("1", value=1)._parent is not mk.atom("1", value=1.0)._parent
+    assert mk.defn("function", "f")._parent is mk.defn("function", "f")._parent
+    assert is_interned(mk.atom("None", value=None))
+    assert not is_interned(mk.atom("x" * 100, type="str"))
+    assert not is_interned(mk.atom(H.b("x")))
+
+
+def test_interned_ensure_id():
+    # Give an id to every node, as a postprocessor could to refer to them
+    def with_id(x, obj, hrepr):
+        return x.ensure_id()
+
+    with_ids = str(hrepr([None, 1, None], postprocess=with_id))
+    ids = re.findall(pattern=r'id="(H\d+)"', string=with_ids)
+    assert len(ids) == 4
+    assert len(set(ids)) == 4
+    assert "id=" not in str(hrepr([None, 1, None]))
+    # Serializing the shared subtrees does not prevent giving ids later
+    assert "id=" in str(hrepr([None, 1, None], postprocess=with_id))
+
+
+def test_intern_unhashable():
+    assert make.intern(("open", ["["]), lambda: H.b("x")) == H.b("x")
+    assert make.intern(("open", ["["]), lambda: H.i("x")) == H.i("x")
+
+
+def test_intern_bounded(monkeypatch):
+    monkeypatch.setattr(make, "_interned", {})
+    monkeypatch.setattr(make, "_intern_size", 10)
+    for i in range(100):
+        make.intern(("test", i), lambda: H.b(i))
+    assert len(make._interned) == 10
+    assert ("test", 99) in make._interned
@@ -0,0 +1,60 @@
+import subprocess
+import sys
+
+import pytest
+
+from hrepr import core, hgen
+
+# Maximum time for `import hrepr`, relative to the time to import ovld, its
+# main dependency, which is imported first and not counted. Comparing the
+# two makes the budget independent of the speed of the machine. hrepr takes
+# about as long as ovld, and importing the modules that are only needed by
+# optional features (sessions, asset files, spooling) makes it about 1.5x.
+IMPORT_BUDGET = 1.25
+
+
+def run_python(*args):
+    return subprocess.run(
+        [sys.executable, *args], capture_output=True, text=True, check=True
+    )
+
+
+def import_times():
+    out = run_python("-X", "importtime", "-c", "import ovld, hrepr").stderr
+    times = {}
+    for line in out.splitlines():
+        _, cumulative, name = line.split("|")
+        if name.strip() in ("ovld", "hrepr"):
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_import_time():
+    ratios = []
+    for _ in range(5):
+        times = import_times()
+        ratios.append(times["hrepr"] / times["ovld"])
+    assert min(ratios) < IMPORT_BUDGET
+
+
+def test_import_is_lazy():
+    out = run_python(
+        "-c",
+        "import sys, hrepr;"
+        "print(hrepr.resource.read_asset.cache_info().currsize);"
+        "print(sorted({'pathlib', 'uuid', 'pickle', 'hashlib',"
+        " 'tempfile', 'hrepr.session', 'hrepr.assets'}"
+        " & set(sys.modules)))",
+    ).stdout
+    assert out.split("\n")[:2] == ["0", "[]"]
+
+
+def test_lazy_attributes():
+    assert core.styledir == core.here / "style"
+    assert (core.styledir / "hrepr.css").exists()
+    assert hgen.css_nbreset.name == "style"
+    assert hgen.constructor_lib is hgen.constructor_lib
+    with pytest.raises(AttributeError):
+        core.unknown_attribute
+    with pytest.raises(AttributeError):
+        hgen.unknown_attribute
@@ -347,3 +347,118 @@ def test_j_as_page(file_regression):
     )
 
     file_regression.check(str(node.as_page()), extension=".html")
+
+
+def module_widgets(n):
+    return H.div(
+        J(namespace="./counter.esm.js").bytwo(
+            returns(H.button("ERROR!", style="width:100px;")),
+        )
+        for _ in range(n)
+    )
+
+
+def test_module_bundled(file_regression):
+    node = H.div(
+        H.h2("The buttons should increment by 2, 3 and 4 respectively."),
+        H.h4(
+            "Note: this will NOT work when browsing the file directly, ",
+            "view using a server e.g. with `python -m http.server`.",
+        ),
+        J(namespace="./counter.esm.js").bytwo(
+            returns(H.button("ERROR!", style="width:100px;")),
+        ),
+        J(namespace="./counter.esm.js").by.three(
+            returns(H.button("ERROR!", style="width:100px;")),
+        ),
+        J(module="./counter.esm.js")(
+            returns(H.button("ERROR!", style="width:100px;")),
+            increment=4,
+        ),
+        J(code=incrementer_code).Counter(
+            returns(H.button("ERROR!", style="width:100px;")), {"increment": 5}
+        ),
+    )
+
+    file_regression.check(str(node.as_page(bundle=True)), extension=".html")
+
+
+def test_bundle_scripts():
+    unbundled = module_widgets(100).as_page()
+    bundled = module_widgets(100).as_page(bundle=True)
+    assert unbundled.count("<script") == 201
+    assert unbundled.count("import ") == 100
+    # constructor library, prepareAll, bundle
+    assert bundled.count("<script") == 3
+    assert bundled.count("import ") == 1
+    assert bundled.count("$$HREPR.prepareAll(") == 1
+    assert bundled.count("$$HREPR.runAll(") == 1
+
+
+def test_bundle_nothing():
+    assert (
+        "runAll" not in H.div("hello").as_page(bundle=True).split("</head>")[1]
+    )
+
+
+def test_bundle_nested():
+    node = J(code=incrementer_code).Counter(
+        returns(J(code=button_creator).make_button("3px solid purple")),
+        {"increment": 1},
+    )
+    page = node.as_page(bundle=True)
+    body = page.split("$$HREPR.runAll(")[1]
+    # The inner J object is created first
+    assert body.index("make_button") < body.index("Counter")
+
+
+def test_lazy(file_regression):
+    node = H.div(
+        H.h2(
+            "The buttons should show 'Click me!' as they are scrolled into view."
+        ),
+        *[
+            H.div(
+                J(code=incrementer_code, lazy="visible").Counter(
+                    returns(H.button("ERROR!", style="width:100px;")),
+                    {"increment": i},
+                ),
+                style="margin-top:100vh;",
+            )
+            for i in range(1, 4)
+        ],
+    )
+
+    file_regression.check(str(node.as_page()), extension=".html")
+
+
+def counters(lazy=None):
+    return H.div(
+        J(code=incrementer_code, lazy=lazy).Counter(
+            returns(H.button("ERROR!")), {"increment": 1}
+        )
+    )
+
+
+def test_lazy_page():
+    assert "$$HREPR.lazy(" not in counters().as_page()
+    assert '$$HREPR.lazy("idle",\'#H' in counters().as_page(lazy="idle")
+    assert '$$HREPR.lazy("visible",\'#H' in counters("visible").as_page()
+    assert "$$HREPR.lazy(" not in counters(False).as_page(lazy="idle")
+
+
+def test_lazy_bundled():
+    page = H.div(counters(), counters("idle")).as_page(bundle=True)
+    body = page.split("$$HREPR.runAll(")[1]
+    assert body.count('},"idle"]') == 1
+    assert body.count("}]") == 1
+
+
+def test_lazy_invalid():
+    with pytest.raises(ValueError, match="lazy must be"):
+        J(code="x", lazy="later")
+
+
+def test_lazy_attribute():
+    page = J(namespace="react").React.lazy("x").as_page()
+    assert ',"lazy","x");' in page
@@ -0,0 +1,190 @@
+import gc
+import sys
+import tracemalloc
+import weakref
+
+import pytest
+
+from hrepr import H, JSExpression, Resource, hrepr, resource, standard_html
+
+# A doubling of the input may at most multiply memory by this factor. Linear
+# growth approaches 2 (less with fixed overhead), quadratic growth approaches 4.
+GROWTH_TOLERANCE = 2.6
+
+# Bytes that may remain allocated after a render is finished and its result
+# has been dropped (interned strings, counters, etc.)
+RETAINED_TOLERANCE = 16_384
+
+
+def measure(fn, *args, warmup=0):
+    """Return (peak, retained) bytes allocated while calling fn(*args).
+
+    The result of fn is dropped before measuring retained memory. fn is
+    first called warmup times while memory is traced, so that the entries
+    that the last call evicts from bounded caches are counted as freed.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        for _ in range(warmup):
+            fn(*args)
+        gc.collect()
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        del result
+        gc.collect()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - before, after - before
+
+
+def check_linear(fn, make_input, sizes):
+    # Warm up caches (dispatch, tag factories) so they are not measured
+    fn(make_input(sizes[0]))
+    peaks = []
+    for size in sizes:
+        data = make_input(size)
+        peak, _ = measure(fn, data)
+        peaks.append(peak)
+    for (n1, p1), (n2, p2) in zip(zip(sizes, peaks), zip(sizes[1:], peaks[1:])):
+        assert p2 / p1 <= GROWTH_TOLERANCE * n2 / n1 / 2, (
+            f"Memory grew from {p1} to {p2} bytes when going from"
+            f" size {n1} to size {n2}: {peaks}"
+        )
+    return peaks
+
+
+def render(obj):
+    return str(hrepr(obj, sequence_max=None))
+
+
+def render_page(obj):
+    return hrepr.page(obj, sequence_max=None)
+
+
+def wide(n):
+    return [{"name": f"item{i}", "values": [i, i + 1, i + 2]} for i in range(n)]
+
+
+def deep(n):
+    data = []
+    for i in range(n):
+        data = [i, data]
+    return data
+
+
+class Payload:
+    def __init__(self, n):
+        self.data = list(range(n))
+
+    def __js_embed__(self, gen):
+        return str(len(self.data))
+
+
+class Widget:
+    def __init__(self, n):
+        self.payload = Payload(n)
+
+    def __hrepr__(self, H, hrepr):
+        # Registers a Resource while rendering
+        return H.button(onclick=JSExpression(f"f({Resource(self.payload)})"))
+
+
+def widgets(n):
+    return [Widget(10) for _ in range(n)]
+
+
+def tag_chain(n):
+    t = H.div()
+    for i in range(n):
+        t = t(H.span(i))
+    return t
+
+
+def tag_tree(n):
+    return H.div(H.ul(H.li["item"](H.b(i), " ", str(i)) for i in range(n)))
+
+
+SIZES = [100, 200, 400]
+
+
+@pytest.fixture(autouse=True)
+def recursion_limit():
+    # Each level of deep() takes about ten frames to render
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, 20 * SIZES[-1]))
+    yield
+    sys.setrecursionlimit(limit)
+
+
+@pytest.mark.parametrize(
+    "fn,make_input",
+    [
+        (render, wide),
+        (render_page, wide),
+        (render, deep),
+        (str, tag_chain),
+        (str, tag_tree),
+        (standard_html.as_page, tag_tree),
+    ],
+    ids=["wide", "page", "deep", "chain", "tree", "tree-page"],
+)
+def test_peak_memory_is_linear(fn, make_input):
+    check_linear(fn, make_input, SIZES)
+
+
+@pytest.mark.parametrize(
+    "fn,make_input",
+    [
+        (render, wide),
+        (render_page, wide),
+        (render, deep),
+        (str, tag_tree),
+        (render, widgets),
+        (render_page, widgets),
+    ],
+    ids=["wide", "page", "deep", "tree", "resources", "resources-page"],
+)
+def test_no_memory_retained_after_render(fn, make_input):
+    data = make_input(SIZES[-1])
+    fn(data)
+    # Fill the bounded caches, so that they replace entries instead of
+    # growing while memory is measured
+    peak, retained = measure(fn, data, warmup=3)
+    assert retained < RETAINED_TOLERANCE, (
+        f"{retained} bytes retained after render (peak was {peak})"
+    )
+
+
+def test_check_linear_detects_quadratic_growth():
+    def quadratic(n):
+        return [list(range(n)) for _ in range(n)]
+
+    with pytest.raises(AssertionError):
+        check_linear(quadratic, int, SIZES)
+
+
+def render_with_resource(n):
+    payload = Payload(n)
+    ref = weakref.ref(payload)
+    with resource.scope():
+        html = str(H.button(onclick=JSExpression(f"f({Resource(payload)})")))
+    return ref, html
+
+
+def test_scoped_resources_are_released():
+    ref, html = render_with_resource(1000)
+    assert 'onclick="f(1000)"' in html
+    gc.collect()
+    assert ref() is None
+
+
+def test_no_memory_retained_by_scoped_resources():
+    render_with_resource(10_000)
+    peak, retained = measure(render_with_resource, 10_000)
+    assert retained < RETAINED_TOLERANCE, (
+        f"{retained} bytes retained after render (peak was {peak})"
+    )
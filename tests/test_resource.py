@@ -1,8 +1,12 @@
+import gc
+import weakref
+
 import pytest
 
-from hrepr import resource
+from hrepr import H, hrepr, resource
+from hrepr.hgen import HTMLGenerator
+from hrepr.resource import JSExpression, Resource
 from hrepr.resource import JSFunction as JSF
-from hrepr.resource import Resource
 
 from .common import one_test_per_assert
 
@@ -33,3 +37,71 @@ def test_JSFunction():
     assert (
         JSF("foo", "foo + 1", expression=False).code == "((foo) => { foo + 1 })"
     )
+
+
+def test_scope():
+    outer = Resource("outer")
+    with resource.scope() as reg:
+        inner = Resource("inner")
+        assert resource.current_registry() is reg
+        assert reg.resolve(inner.id) is inner
+        assert reg.resolve(outer.id) is outer
+        with resource.scope() as reg2:
+            innermost = Resource("innermost")
+            assert reg2.resolve(inner.id) is inner
+        assert innermost.id not in reg.id_to_resource
+    assert resource.current_registry() is resource.registry
+    assert (outer.id, inner.id, innermost.id) == (0, 1, 2)
+    with pytest.raises(KeyError):
+        resource.registry.resolve(inner.id)
+    assert resource.registry.resolve(outer.id) is outer
+
+
+class Payload:
+    def __js_embed__(self, gen):
+        return "1"
+
+
+class Widget:
+    def __init__(self):
+        self.payload = Payload()
+
+    def __hrepr__(self, H, hrepr):
+        return H.button(onclick=JSExpression(f"f({Resource(self.payload)})"))
+
+
+def check_released(render):
+    widget = Widget()
+    ref = weakref.ref(widget.payload)
+    assert 'onclick="f(1)"' in render(widget)
+    del widget
+    gc.collect()
+    assert ref() is None
+    assert resource.registry.id_to_resource == {}
+
+
+def test_page_releases_resources():
+    check_released(hrepr.page)
+
+
+def test_generator_releases_resources():
+    check_released(HTMLGenerator(hrepr=hrepr))
+
+
+def test_hrepr_releases_resources():
+    check_released(lambda w: str(hrepr(w)))
+    check_released(lambda w: hrepr(w)._repr_html_())
+    check_released(lambda w: str(H.div(hrepr(w))))
+
+
+def test_hrepr_holds_resources():
+    widget = Widget()
+    ref = weakref.ref(widget.payload)
+    tag = hrepr(widget)["x"]
+    del widget
+    gc.collect()
+    assert 'onclick="f(1)"' in str(H.div(tag))
+    assert resource.registry.id_to_resource == {}
+    del tag
+    gc.collect()
+    assert ref() is None
@@ -0,0 +1,177 @@
+import copy
+import pickle
+from dataclasses import dataclass
+
+import pytest
+
+from hrepr import H, J, Tag, hrepr, serial
+from hrepr.resource import JSExpression
+from hrepr.serial import TagCache, dumps, loads
+
+from .common import one_test_per_assert
+
+
+@dataclass
+class Point:
+    x: int
+    y: int
+
+
+class CustomTag(Tag):
+    __slots__ = ()
+
+
+def roundtrip(x):
+    return loads(dumps(x)) == x
+
+
+@one_test_per_assert
+def test_roundtrip():
+    assert roundtrip(H.div())
+    assert roundtrip(H.div("hello", 1, -1, 2.5, 10**30, -(10**30), None))
+    assert roundtrip(H.div["a", "b"](id="x", hidden=True, disabled=False))
+    assert roundtrip(H.div(style={"color": "red"}, data=[1, (2, 3)]))
+    assert roundtrip(H.div(H.span(H.b("nested")), H.i("é ∀ 🐍")))
+    assert roundtrip(H.div("x", resources=[H.style("b { color: red; }")]))
+    assert roundtrip(H.div(Point(1, 2)))
+    assert roundtrip(CustomTag(name="custom")("x"))
+    assert roundtrip(
+        hrepr({"a": [1, 2, (3, 4)], "b": {5, 6}, "c": Point(1, 2)})
+    )
+    assert roundtrip(hrepr([[1, 2]] * 2))
+    assert roundtrip(["not", "a", "tag"])
+
+
+def test_types_preserved():
+    tag = loads(dumps(H.div(CustomTag(name="custom"))))
+    assert type(tag) is type(H.div)
+    assert type(tag.children[0]) is CustomTag
+
+
+def test_shared_subtrees():
+    shared = H.style("b { color: red; }")
+    tag = H.div(H.span("a", resources=shared), H.span("b", resources=shared))
+    data = dumps(tag)
+    assert data.count(b"color: red") == 1
+    new_tag = loads(data)
+    assert new_tag == tag
+    r1 = new_tag.children[0].resources[0]
+    r2 = new_tag.children[1].resources[0]
+    assert r1 is r2
+
+
+def test_interned_strings():
+    data = dumps(H.div(*[H.span["some-class"]("x") for i in range(100)]))
+    assert data.count(b"some-class") == 1
+
+
+def test_splice():
+    fragment = loads(dumps(hrepr([1, 2, 3])))
+    assert str(H.div(fragment)) == str(H.div(hrepr([1, 2, 3])))
+
+
+def test_pickle():
+    tag = H.div["a"](H.b("hello"), JSExpression("x"), id="y")
+    new_tag = pickle.loads(pickle.dumps(tag))
+    assert type(new_tag) is type(tag)
+    assert new_tag.children[0] == tag.children[0]
+    assert new_tag.children[1].code == "x"
+    assert pickle.loads(pickle.dumps(H.div)) == H.div
+
+
+def test_copy():
+    tag = H.div(J(module="x").f(lambda: 1))
+    assert copy.copy(tag) is tag
+    assert copy.deepcopy(tag) is tag
+    assert copy.deepcopy([tag])[0] is tag
+
+
+def test_bad_data():
+    data = dumps(H.div("hello"))
+    with pytest.raises(ValueError, match="Not a serialized"):
+        loads(b"XXX" + data[3:])
+    with pytest.raises(ValueError, match="Unsupported serialization version"):
+        loads(data[:3] + b"\x00" + data[4:])
+    with pytest.raises(ValueError, match="Truncated"):
+        loads(data[:-2])
+    with pytest.raises(ValueError, match="Truncated"):
+        loads(dumps(H.div(Point(1, 2)))[:-2])
+    with pytest.raises(ValueError, match="Invalid opcode"):
+        loads(b"HRT\x01\x00\xff")
+
+
+def test_cache(tmp_path):
+    calls = []
+
+    def render():
+        calls.append(1)
+        return hrepr({"x": [1, 2]})
+
+    cache = TagCache(tmp_path / "cache")
+    t1 = cache.fetch("content", render)
+    t2 = cache.fetch("content", render)
+    t3 = TagCache(tmp_path / "cache").fetch(b"content", render)
+    assert t1 == t2 == t3 == render()
+    assert len(calls) == 2
+    assert cache.get("other content") is None
+
+
+def test_cache_corrupt(tmp_path):
+    cache = TagCache(tmp_path)
+    cache.put("content", H.div("hello"))
+    with open(cache.path("content"), "wb") as f:
+        f.write(b"garbage")
+    assert cache.get("content", 1234) == 1234
+    assert cache.fetch("content", lambda: H.div("x")) == H.div("x")
+
+
+def _corrupt(*ops, strings=()):
+    data = bytearray(serial.MAGIC)
+    data.append(serial.VERSION)
+    serial._write_varint(data, len(strings))
+    for string in strings:
+        serial._write_varint(data, len(string))
+        data += string.encode("utf8")
+    for op in ops:
+        if isinstance(op, bytes):
+            data += op
+        else:
+            serial._write_varint(data, op)
+    return bytes(data)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        dumps(H.div("hello"))[:-3],
+        _corrupt(serial.STR, 3),
+        _corrupt(serial.PICKLE, 3, b"abc"),
+        _corrupt(serial.PICKLE, 0),
+        _corrupt(serial.TAG, serial.CLASS, 0, 1, strings=["hrepr.nope", "Tag"]),
+        _corrupt(serial.TAG, serial.CLASS, 0, 1, strings=["hrepr", "nope"]),
+        _corrupt(
+            serial.TAG, serial.CLASS, 0, 1, 1, 0, 0, 0, strings=["os", "sep"]
+        ),
+    ],
+    ids=[
+        "truncated",
+        "string",
+        "pickle",
+        "pickle-eof",
+        "module",
+        "class",
+        "call",
+    ],
+)
+def test_cache_undecodable(tmp_path, data):
+    cache = TagCache(tmp_path)
+    with open(cache.path("content"), "wb") as f:
+        f.write(data)
+    assert cache.get("content", 1234) == 1234
+
+
+def test_cache_failure(tmp_path):
+    cache = TagCache(tmp_path)
+    with pytest.raises(Exception):
+        cache.put("content", H.div(lambda: 1))
+    assert list(tmp_path.iterdir()) == []
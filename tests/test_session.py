@@ -0,0 +1,77 @@
+import pytest
+
+from hrepr import H, HTMLGenerator
+from hrepr.session import ResourceSession, SessionStore, resource_digest
+
+css = H.style("b { color: red; }")
+tag = H.b("hello", resources=css)
+
+
+@pytest.fixture
+def gen():
+    return HTMLGenerator()
+
+
+def test_resources_sent_once_per_session(gen):
+    assert "<style>" in gen(tag, session="alice")
+    assert "<style>" not in gen(tag, session="alice")
+    assert "<style>" in gen(tag, session="bob")
+    assert "<style>" not in gen(H.i("x", resources=css), session="bob")
+
+
+def test_resources_sent_once_without_session(gen):
+    assert "<style>" in gen(tag)
+    assert "<style>" not in gen(tag)
+    assert "<style>" in gen(tag, session=ResourceSession())
+
+
+def test_content_hash(gen):
+    session = ResourceSession()
+    session.add(H.style("b { color: red; }"))
+    assert css in session
+    assert H.style("b { color: blue; }") not in session
+    assert "<style>" not in gen(tag, session=session)
+    assert resource_digest(css) == resource_digest(H.style("b { color: red; }"))
+    assert resource_digest(H.div(onclick=lambda: 1)) != resource_digest(css)
+
+
+def test_bounded_resources():
+    session = ResourceSession(max_resources=3)
+    styles = [H.style(f"a{i} {{}}") for i in range(5)]
+    for style in styles:
+        session.add(style)
+    assert len(session) == 3
+    assert styles[0] not in session
+    assert styles[4] in session
+    session.clear()
+    assert len(session) == 0
+
+
+def test_session_lru():
+    store = SessionStore(max_sessions=2)
+    a = store.get("a")
+    store.get("b")
+    assert store.get("a") is a
+    store.get("c")
+    assert "a" in store
+    assert "b" not in store
+    assert len(store) == 2
+    store.discard("a")
+    store.discard("a")
+    assert len(store) == 1
+
+
+def test_session_idle(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("hrepr.session.time.monotonic", lambda: now[0])
+    store = SessionStore(max_idle=10)
+    a = store.get("a")
+    now[0] += 5
+    store.get("b")
+    now[0] += 6
+    assert store.get("a") is a
+    assert "b" in store
+    now[0] += 11
+    store.get("c")
+    assert "a" not in store
+    assert "b" not in store
@@ -0,0 +1,134 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import pytest
+
+from hrepr import HTML, H, Tag, h, hrepr
+from hrepr.resource import Registry
+
+NTHREADS = 16
+
+
+@pytest.fixture(autouse=True)
+def frequent_switches():
+    # Switch threads as often as possible to expose races on builds that
+    # have a GIL
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def run_parallel(fn, n=NTHREADS * 8):
+    with ThreadPoolExecutor(NTHREADS) as pool:
+        return list(pool.map(lambda _: fn(), range(n)))
+
+
+@dataclass
+class Point:
+    x: int
+    y: int
+
+
+def test_parallel_renders():
+    shared = [1, 2]
+    data = {
+        "points": [Point(i, [i] * 3) for i in range(20)],
+        "shared": [shared, shared],
+        "text": "hello " * 10,
+    }
+    expected = str(hrepr(data))
+    results = run_parallel(lambda: str(hrepr(data)))
+    assert all(result == expected for result in results)
+    pages = run_parallel(lambda: hrepr.page(data), n=NTHREADS)
+    assert len(set(pages)) == 1
+
+
+def test_parallel_construction():
+    for _ in range(20):
+        base = H.div["base"]("x", [H.b(i) for i in range(50)])
+        tags = [base[f"c{i}"](H.i(i)) for i in range(10)]
+
+        def construct():
+            return [str(t) for t in [base, *tags]]
+
+        results = run_parallel(construct, n=NTHREADS)
+        assert all(result == results[0] for result in results)
+        assert results[0][0].count("<b>") == 50
+
+
+def test_parallel_construction_chain():
+    for _ in range(20):
+        chain = [H.div]
+        for i in range(30):
+            chain.append(chain[-1][f"c{i}"](str(i)))
+
+        def construct():
+            # Construct children before and after their parents
+            return [str(t) for t in chain[::-1] + chain]
+
+        results = run_parallel(construct, n=NTHREADS)
+        assert all(result == results[0] for result in results)
+        classes = " ".join(f"c{i}" for i in range(30))
+        digits = "".join(str(i) for i in range(30))
+        assert results[0][0] == f'<div class="{classes}">{digits}</div>'
+
+
+def test_parallel_ensure_id():
+    tags = [H.div(i) for i in range(200)]
+
+    def ensure_ids():
+        for t in tags:
+            t.ensure_id()
+        return [t.id for t in tags]
+
+    results = run_parallel(ensure_ids, n=NTHREADS)
+    assert all(result == results[0] for result in results)
+    assert len(set(results[0])) == len(tags)
+
+
+def test_parallel_factory():
+    for _ in range(20):
+        factory = HTML()
+        names = [f"custom-tag-{i}" for i in range(20)]
+
+        def lookup():
+            return [getattr(factory, name) for name in names]
+
+        results = run_parallel(lookup, n=NTHREADS)
+        for result in results:
+            assert all(a is b for a, b in zip(result, results[0]))
+        assert all(
+            type(t) is Tag.specialize(name)
+            for t, name in zip(results[0], names)
+        )
+
+
+def test_parallel_specialize():
+    for i in range(20):
+        name = f"specialize-race-{i}"
+        classes = run_parallel(lambda: Tag.specialize(name), n=NTHREADS)
+        assert all(cls is classes[0] for cls in classes)
+
+
+def test_parallel_ids():
+    ids = run_parallel(lambda: [h.next_id() for _ in range(100)])
+    flat = [i for batch in ids for i in batch]
+    assert len(set(flat)) == len(flat)
+
+
+def test_parallel_registry():
+    registry = Registry()
+    objects = run_parallel(lambda: [object() for _ in range(10)])
+
+    results = []
+
+    def register():
+        batch = objects.pop()
+        results.append([(registry.register(obj), obj) for obj in batch])
+
+    run_parallel(register)
+    pairs = [pair for batch in results for pair in batch]
+    assert len({i for i, _ in pairs}) == len(pairs)
+    assert all(registry.resolve(i) is obj for i, obj in pairs)